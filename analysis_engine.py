@@ -0,0 +1,1950 @@
+import os
+import sys
+import argparse
+import asyncio
+import functools
+import glob
+import importlib
+import inspect
+import json
+import hashlib
+import math
+import random
+import sqlite3
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+# Módulo importado apenas no primeiro acesso a um de seus atributos, de modo que a partida
+# não paga por bibliotecas que a etapa atual não usa. Atributos atribuídos antes da
+# importação ficam guardados e são aplicados ao módulo quando ele é carregado. O proxy não
+# entra em sys.modules: quem percorre os módulos importados não dispara o carregamento
+class LazyModule:
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+        self.__dict__['_pending'] = {}
+
+    def _load(self):
+        module = self._module
+        if module is None:
+            module = importlib.import_module(self._name)
+            for attr, value in self._pending.items():
+                setattr(module, attr, value)
+            self._pending.clear()
+            self.__dict__['_module'] = module
+        return module
+
+    def __getattr__(self, attr):
+        if self._module is None and attr in self._pending:
+            return self._pending[attr]
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        if self._module is None:
+            self._pending[attr] = value
+        else:
+            setattr(self._module, attr, value)
+
+    def __repr__(self):
+        state = "carregado" if self._module is not None else "não carregado"
+        return f"<LazyModule {self._name} ({state})>"
+
+pd = LazyModule("pandas")
+np = LazyModule("numpy")
+pa = LazyModule("pyarrow")
+feather = LazyModule("pyarrow.feather")
+openai = LazyModule("openai")
+
+# Colunas de dimensão do dataset de vendas e ordem natural das estações
+DIMENSION_COLUMNS = ['Cidade', 'Bairro', 'Estação', 'Marca']
+SEASON_ORDER = ["Verão", "Outono", "Inverno", "Primavera"]
+
+# Configurações da leitura dos CSVs e dos snapshots colunares
+CSV_READ_OPTIONS = {}
+SNAPSHOT_MEMORY_MAP = True
+
+# Prepara a tabela lida do CSV para o snapshot: vendas numéricas e dimensões
+# como categorias, que o Arrow grava como colunas codificadas em dicionário
+def clean_sales_table(df):
+    df_clean = df.copy()
+    if 'Vendas (litros)' in df_clean.columns:
+        df_clean['Vendas (litros)'] = pd.to_numeric(df_clean['Vendas (litros)'], errors='coerce')
+    for col in DIMENSION_COLUMNS:
+        if col in df_clean.columns and not isinstance(df_clean[col].dtype, pd.CategoricalDtype):
+            df_clean[col] = df_clean[col].astype('category')
+    return df_clean
+
+# Grava o snapshot colunar (Arrow IPC/Feather) com o hash da origem nos metadados.
+# Sem compressão quando o mapeamento em memória está ativo, para permitir leitura sem cópia.
+def save_snapshot(df, path, source_hash, memory_map=SNAPSHOT_MEMORY_MAP):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[b"source_hash"] = source_hash.encode("utf-8")
+    table = table.replace_schema_metadata(metadata)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    feather.write_feather(table, tmp_path, compression="uncompressed" if memory_map else "lz4")
+    os.replace(tmp_path, path)
+
+# Lê o snapshot diretamente, sem reprocessar o CSV; devolve None se ele não
+# corresponder ao hash da origem (arquivo de origem alterado)
+def load_snapshot(path, source_hash=None, memory_map=SNAPSHOT_MEMORY_MAP):
+    if memory_map:
+        with pa.memory_map(path, "r") as source:
+            table = pa.ipc.open_file(source).read_all()
+    else:
+        table = feather.read_table(path, memory_map=False)
+    stored_hash = (table.schema.metadata or {}).get(b"source_hash", b"").decode("utf-8")
+    if source_hash is not None and stored_hash != source_hash:
+        return None
+    return table.to_pandas()
+
+# Cache de ingestão em duas camadas (memória e snapshots colunares em disco), indexado
+# pelo hash do conteúdo do arquivo e pelas opções de leitura, com despejo LRU limitado
+# por tamanho em bytes. Os DataFrames devolvidos são compartilhados: quem os recebe não
+# deve alterá-los no lugar.
+class IngestionCache:
+    def __init__(self, cache_dir, max_memory_bytes, max_disk_bytes, memory_map=SNAPSHOT_MEMORY_MAP):
+        self.cache_dir = cache_dir
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.memory_map = memory_map
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._path_hashes = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(content_hash, read_options):
+        options = json.dumps(read_options, sort_keys=True, default=str)
+        return f"{content_hash}-{hashlib.sha256(options.encode('utf-8')).hexdigest()[:16]}"
+
+    # Hash SHA-256 do conteúdo; para arquivos locais o hash é reaproveitado enquanto
+    # tamanho e data de modificação não mudarem, evitando reler o arquivo a cada rerun
+    def content_hash(self, file):
+        if isinstance(file, (str, os.PathLike)):
+            stat = os.stat(file)
+            signature = (os.path.abspath(file), stat.st_size, stat.st_mtime_ns)
+            with self._lock:
+                cached = self._path_hashes.get(signature)
+            if cached is not None:
+                return cached
+            digest = hashlib.sha256()
+            with open(file, "rb") as f:
+                for block in iter(lambda: f.read(8 * 1024 * 1024), b""):
+                    digest.update(block)
+            content_hash = digest.hexdigest()
+            with self._lock:
+                stale = [sig for sig in self._path_hashes if sig[0] == signature[0]]
+                stale_hashes = {self._path_hashes.pop(sig) for sig in stale}
+                self._path_hashes[signature] = content_hash
+            for stale_hash in stale_hashes - {content_hash}:
+                self.invalidate(stale_hash)
+            return content_hash
+        if hasattr(file, "getvalue"):
+            return hashlib.sha256(file.getvalue()).hexdigest()
+        file.seek(0)
+        digest = hashlib.sha256(file.read())
+        file.seek(0)
+        return digest.hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return self._memory[key][0]
+        path = self._disk_path(key)
+        if os.path.exists(path):
+            try:
+                df = load_snapshot(path, key.split("-")[0], memory_map=self.memory_map)
+                if df is None:
+                    os.remove(path)
+                else:
+                    os.utime(path)
+            except Exception:
+                df = None
+            if df is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                self._put_memory(key, df)
+                return df
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, df):
+        self._put_memory(key, df)
+        self._put_disk(key, df)
+
+    # Descarta todas as entradas derivadas de um conteúdo de origem que mudou
+    def invalidate(self, content_hash):
+        prefix = f"{content_hash}-"
+        with self._lock:
+            for key in [k for k in self._memory if k.startswith(prefix)]:
+                self._memory_bytes -= self._memory.pop(key)[1]
+        for name in os.listdir(self.cache_dir):
+            if name.startswith(prefix):
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+            }
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.arrow")
+
+    def _put_memory(self, key, df):
+        size = int(df.memory_usage(deep=True).sum())
+        if size > self.max_memory_bytes:
+            return
+        with self._lock:
+            if key in self._memory:
+                self._memory_bytes -= self._memory.pop(key)[1]
+            self._memory[key] = (df, size)
+            self._memory_bytes += size
+            while self._memory_bytes > self.max_memory_bytes:
+                _, (_, evicted_size) = self._memory.popitem(last=False)
+                self._memory_bytes -= evicted_size
+
+    def _put_disk(self, key, df):
+        try:
+            save_snapshot(df, self._disk_path(key), key.split("-")[0], memory_map=self.memory_map)
+        except (OSError, pa.ArrowException):
+            return
+        self._evict_disk()
+
+    # Remove os arquivos menos usados recentemente até respeitar o limite em disco
+    def _evict_disk(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".arrow"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+# Cache LRU genérico limitado por número de entradas e seguro entre threads
+class BoundedLRU:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                return default
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+# Impressão digital do conteúdo do DataFrame (colunas, tipos e valores)
+def content_fingerprint(df):
+    digest = hashlib.sha256()
+    digest.update(json.dumps([[str(c) for c in df.columns], [str(t) for t in df.dtypes]]).encode("utf-8"))
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+# Lê o CSV de vendas já preparado para análise, consultando antes o cache de ingestão
+# quando um é informado
+def read_sales_table(file, cache=None, read_options=CSV_READ_OPTIONS):
+    if cache is None:
+        return clean_sales_table(pd.read_csv(file, **read_options))
+    key = cache.make_key(cache.content_hash(file), read_options)
+    df = cache.get(key)
+    if df is None:
+        if hasattr(file, "seek"):
+            file.seek(0)
+        df = clean_sales_table(pd.read_csv(file, **read_options))
+        cache.put(key, df)
+    return df
+
+# Converte uma dimensão para categoria ordenada; as estações seguem a ordem do ano
+# e as demais dimensões a ordem alfabética
+def to_ordered_category(series, name):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        values = [v for v in series.cat.categories if pd.notna(v)]
+    else:
+        values = series.dropna().unique().tolist()
+    if name == 'Estação':
+        categories = [s for s in SEASON_ORDER if s in values]
+        categories += sorted(str(v) for v in values if v not in SEASON_ORDER)
+    else:
+        categories = sorted(values, key=str)
+    return series.astype(pd.CategoricalDtype(categories=categories, ordered=True))
+
+# Reduz as vendas para int32 quando os valores são inteiros e cabem no tipo;
+# caso contrário tenta float32 sem perda de precisão
+def to_compact_numeric(series):
+    values = series.to_numpy()
+    if series.isna().any() or not np.all(np.mod(values, 1) == 0):
+        return pd.to_numeric(series, downcast='float')
+    int32 = np.iinfo(np.int32)
+    if len(series) == 0 or (values.min() >= int32.min and values.max() <= int32.max):
+        return series.astype(np.int32)
+    return series
+
+# Memória que a coluna ocuparia com os tipos padrão do pandas (texto como objeto
+# Python e números em 64 bits), estimada sem materializar as strings
+def default_dtype_memory(series):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = series.cat.codes.to_numpy()
+        counts = np.bincount(codes[codes >= 0], minlength=len(series.cat.categories))
+        sizes = np.array([sys.getsizeof(v) for v in series.cat.categories], dtype=np.int64)
+        return int(8 * len(series) + counts @ sizes + sys.getsizeof(np.nan) * np.count_nonzero(codes < 0))
+    if pd.api.types.is_numeric_dtype(series):
+        return 8 * len(series)
+    return int(series.memory_usage(index=False, deep=True))
+
+# Relatório de memória por coluna: tipos padrão versus tipos otimizados
+def memory_report(df_before, df_after):
+    rows = []
+    for col in df_after.columns:
+        rows.append({
+            'Coluna': col,
+            'Tipo Original': str(df_before[col].dtype),
+            'Tipo Otimizado': str(df_after[col].dtype),
+            'Antes (KB)': default_dtype_memory(df_before[col]) / 1024,
+            'Depois (KB)': df_after[col].memory_usage(index=False, deep=True) / 1024
+        })
+    return pd.DataFrame(rows)
+
+# Configurações da detecção de outliers
+QUANTILE_SKETCH_K = 200
+QUANTILE_SKETCH_EXACT_LIMIT = 10_000
+OUTLIER_GROUP_OPTIONS = {"Global": None, "Por Marca": "Marca", "Por Estação": "Estação"}
+
+# Esboço de quantis KLL: compactadores por nível, em que cada item do nível h representa
+# 2^h valores. Ao encher, um nível é ordenado e metade dos itens (posições pares ou ímpares,
+# sorteadas) sobe para o nível seguinte. O erro de posto é O(n / k) com memória
+# O(k log(n / k)), e dois esboços se combinam somando os níveis. Até exact_limit valores
+# nada é compactado, de modo que conjuntos pequenos têm quantis exatos
+class KLLSketch:
+    def __init__(self, k=QUANTILE_SKETCH_K, seed=None, exact_limit=QUANTILE_SKETCH_EXACT_LIMIT):
+        self.k = k
+        self.exact_limit = exact_limit
+        self.n = 0
+        self.levels = [np.empty(0, dtype=np.float64)]
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(int(np.ceil(self.k * (2 / 3) ** depth)), 2)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self.n += len(values)
+        self._compress()
+        return self
+
+    def merge(self, other):
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0, dtype=np.float64))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.n += other.n
+        self._compress()
+        return self
+
+    def _compress(self):
+        if len(self.levels) == 1 and self.n <= self.exact_limit:
+            return
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) >= self._capacity(level):
+                items = np.sort(items)
+                # Com tamanho ímpar, o maior item permanece no nível atual
+                keep = items[-1:] if len(items) % 2 else items[:0]
+                paired = items[:len(items) - len(keep)]
+                promoted = paired[self._rng.integers(0, 2)::2]
+                self.levels[level] = keep
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0, dtype=np.float64))
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level += 1
+
+    # Itens ordenados com seus pesos acumulados
+    def _weighted_items(self):
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items_), 2 ** level, dtype=np.float64) for level, items_ in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        return items[order], np.cumsum(weights[order])
+
+    # Enquanto nenhum nível foi compactado os quantis são exatos (interpolação linear,
+    # como no pandas); depois disso, são aproximados pelo posto ponderado
+    def quantile(self, probabilities):
+        probabilities = np.atleast_1d(np.asarray(probabilities, dtype=np.float64))
+        if self.n == 0:
+            return np.full(len(probabilities), np.nan)
+        if len(self.levels) == 1:
+            return np.quantile(self.levels[0], probabilities)
+        items, cumulative = self._weighted_items()
+        positions = np.searchsorted(cumulative, probabilities * cumulative[-1], side='left')
+        return items[np.minimum(positions, len(items) - 1)]
+
+    # Número (estimado) de valores estritamente menores que x
+    def rank(self, x):
+        if self.n == 0:
+            return 0.0
+        items, cumulative = self._weighted_items()
+        position = np.searchsorted(items, x, side='left')
+        return float(cumulative[position - 1]) if position > 0 else 0.0
+
+# Detector de outliers pelo critério IQR (1,5 x intervalo interquartil), global ou por
+# grupo, com um esboço de quantis por grupo. Processa blocos em uma única passada e
+# detectores de partições diferentes podem ser combinados com merge
+class IQROutlierDetector:
+    def __init__(self, group_by=None, value_col='Vendas (litros)', k=QUANTILE_SKETCH_K):
+        self.group_by = group_by
+        self.value_col = value_col
+        self.k = k
+        self.sketches = {}
+
+    def _sketch(self, group):
+        if group not in self.sketches:
+            self.sketches[group] = KLLSketch(self.k, seed=0)
+        return self.sketches[group]
+
+    def update(self, chunk):
+        values = pd.to_numeric(chunk[self.value_col], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+        if self.group_by is None:
+            self._sketch(None).update(values)
+            return self
+        codes, uniques = pd.factorize(chunk[self.group_by], sort=False)
+        order = np.argsort(codes, kind='stable')
+        boundaries = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+        sorted_values = values[order]
+        for i, group in enumerate(uniques):
+            self._sketch(group).update(sorted_values[boundaries[i]:boundaries[i + 1]])
+        return self
+
+    def merge(self, other):
+        for group, sketch in other.sketches.items():
+            if group in self.sketches:
+                self.sketches[group].merge(sketch)
+            else:
+                self.sketches[group] = sketch
+        return self
+
+    def bounds(self):
+        rows = []
+        for group, sketch in self.sketches.items():
+            q1, q3 = sketch.quantile([0.25, 0.75])
+            iqr = q3 - q1
+            rows.append({
+                'Grupo': 'Todos' if group is None else group,
+                'Q1': q1,
+                'Q3': q3,
+                'IQR': iqr,
+                'Limite Inferior': q1 - 1.5 * iqr,
+                'Limite Superior': q3 + 1.5 * iqr
+            })
+        return pd.DataFrame(rows, columns=['Grupo', 'Q1', 'Q3', 'IQR', 'Limite Inferior', 'Limite Superior'])
+
+    # Máscara booleana (array NumPy) dos outliers de um bloco
+    def flag(self, chunk):
+        values = pd.to_numeric(chunk[self.value_col], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+        bounds = self.bounds()
+        if self.group_by is None:
+            lower = bounds['Limite Inferior'].iloc[0] if len(bounds) else np.nan
+            upper = bounds['Limite Superior'].iloc[0] if len(bounds) else np.nan
+        else:
+            bounds = bounds.set_index('Grupo')
+            keys = chunk[self.group_by].astype(object)
+            lower = keys.map(bounds['Limite Inferior']).to_numpy(dtype=np.float64, na_value=np.nan)
+            upper = keys.map(bounds['Limite Superior']).to_numpy(dtype=np.float64, na_value=np.nan)
+        return (values < lower) | (values > upper)
+
+    # Número estimado de outliers a partir dos postos dos limites em cada esboço
+    def estimated_outliers(self):
+        total = 0.0
+        for _, row in self.bounds().iterrows():
+            sketch = self.sketches[None if self.group_by is None else row['Grupo']]
+            total += sketch.rank(row['Limite Inferior']) + sketch.n - sketch.rank(np.nextafter(row['Limite Superior'], np.inf))
+        return int(round(total))
+
+# Função para limpar e pré-processar os dados
+def preprocess_data(df, outlier_group=None, progress=None):
+    # Cópia para não modificar o original
+    df_clean = df.copy()
+    if progress is not None:
+        progress(0.1, "verificando valores ausentes e tipos")
+    
+    # Verificar valores ausentes
+    missing_values = df_clean.isnull().sum()
+    
+    # Verificar tipos de dados
+    dtypes = df_clean.dtypes
+    
+    # Converter colunas se necessário
+    if 'Vendas (litros)' in df_clean.columns:
+        df_clean['Vendas (litros)'] = to_compact_numeric(pd.to_numeric(df_clean['Vendas (litros)'], errors='coerce'))
+    
+    # Dimensões como categorias ordenadas: agrupamentos e filtros passam a comparar códigos inteiros
+    for col in DIMENSION_COLUMNS:
+        if col in df_clean.columns:
+            df_clean[col] = to_ordered_category(df_clean[col], col)
+    
+    memory = memory_report(df, df_clean)
+    if progress is not None:
+        progress(0.6, "detectando outliers")
+    
+    # Verificar outliers nas vendas (critério IQR, global ou por grupo)
+    if 'Vendas (litros)' in df_clean.columns:
+        detector = IQROutlierDetector(group_by=outlier_group).update(df_clean)
+        outliers = df_clean[detector.flag(df_clean)]
+        outlier_bounds = detector.bounds()
+    else:
+        outliers = pd.DataFrame()
+        outlier_bounds = pd.DataFrame()
+    
+    return df_clean, missing_values, dtypes, outliers, memory, outlier_bounds
+
+# Configurações do cubo de agregação
+CUBE_MEDIAN_DIMENSIONS = [('Marca',), ('Estação',)]
+
+# Cubo de agregação: uma única passada sobre as linhas produz contagem, soma, soma dos
+# quadrados, mínimo e máximo para cada combinação das dimensões; as etapas de análise
+# consolidam (roll-up) a partir das células em vez de reagrupar as linhas
+class AggregationCube:
+    def __init__(self, cells, dims, integer_values, quantiles=None, medians=None):
+        self.cells = cells
+        self.dims = dims
+        self.integer_values = integer_values
+        self.quantiles = quantiles
+        self.medians = medians or {}
+
+    # Células do cubo para um bloco de linhas
+    @staticmethod
+    def build_cells(df, value_col='Vendas (litros)'):
+        dims = [col for col in DIMENSION_COLUMNS if col in df.columns]
+        values = df[value_col].astype('float64')
+        frame = df[dims].assign(_value=values, _square=values * values)
+        return frame.groupby(dims, observed=True, dropna=False, sort=False).agg(
+            count=('_value', 'count'),
+            sum=('_value', 'sum'),
+            sumsq=('_square', 'sum'),
+            min=('_value', 'min'),
+            max=('_value', 'max')
+        ).reset_index()
+
+    # Combina células de blocos diferentes; o resultado é limitado pela cardinalidade
+    # das dimensões, não pelo número de linhas lidas
+    @staticmethod
+    def merge_cells(*cells_list):
+        cells = pd.concat(cells_list, ignore_index=True)
+        dims = [col for col in DIMENSION_COLUMNS if col in cells.columns]
+        return cells.groupby(dims, observed=True, dropna=False, sort=False).agg(
+            count=('count', 'sum'),
+            sum=('sum', 'sum'),
+            sumsq=('sumsq', 'sum'),
+            min=('min', 'min'),
+            max=('max', 'max')
+        ).reset_index()
+
+    @classmethod
+    def build(cls, df, value_col='Vendas (litros)'):
+        dims = [col for col in DIMENSION_COLUMNS if col in df.columns]
+        values = df[value_col].astype('float64')
+        cells = cls.build_cells(df, value_col)
+        # Quantis e medianas não são decomponíveis em somas; são calculados uma vez na construção
+        quantiles = values.quantile([0.25, 0.5, 0.75])
+        medians = {
+            group: df.groupby(list(group), observed=True)[value_col].median()
+            for group in CUBE_MEDIAN_DIMENSIONS
+            if all(col in dims for col in group)
+        }
+        return cls(cells, dims, pd.api.types.is_integer_dtype(df[value_col]), quantiles, medians)
+
+    # Subcubo com as células que atendem à seleção {dimensão: valores}
+    def filter(self, selections):
+        mask = np.ones(len(self.cells), dtype=bool)
+        for col, values in selections.items():
+            mask &= self.cells[col].isin(values).to_numpy()
+        return AggregationCube(self.cells[mask], self.dims, self.integer_values)
+
+    # Consolida as células nas dimensões pedidas, com média e desvio padrão amostral
+    def rollup(self, dims):
+        if dims:
+            agg = self.cells.groupby(dims, observed=True).agg(
+                count=('count', 'sum'),
+                sum=('sum', 'sum'),
+                sumsq=('sumsq', 'sum'),
+                min=('min', 'min'),
+                max=('max', 'max')
+            ).reset_index()
+        else:
+            agg = pd.DataFrame({
+                'count': [self.cells['count'].sum()],
+                'sum': [self.cells['sum'].sum()],
+                'sumsq': [self.cells['sumsq'].sum()],
+                'min': [self.cells['min'].min()],
+                'max': [self.cells['max'].max()]
+            })
+        count = agg['count'].astype('float64')
+        agg['mean'] = agg['sum'] / count.where(count > 0)
+        variance = (agg['sumsq'] - agg['sum'] * agg['mean']) / (count - 1).where(count > 1)
+        agg['std'] = np.sqrt(variance.clip(lower=0))
+        if self.integer_values:
+            agg['sum'] = agg['sum'].round().astype('int64')
+        if tuple(dims) in self.medians:
+            agg['median'] = agg[dims[0]].map(self.medians[tuple(dims)]).astype('float64')
+        return agg
+
+    # Equivalente a Series.describe() das vendas, obtido do cubo
+    def describe(self):
+        total = self.rollup([]).iloc[0]
+        stats = {'count': float(total['count']), 'mean': total['mean'], 'std': total['std'], 'min': total['min']}
+        if self.quantiles is not None:
+            stats.update({'25%': self.quantiles[0.25], '50%': self.quantiles[0.5], '75%': self.quantiles[0.75]})
+        stats['max'] = total['max']
+        return pd.Series(stats, name='Vendas (litros)')
+
+# Configurações do índice de filtros
+FILTER_BITMAP_CACHE_MAX_ENTRIES = 64
+
+# Índice de filtros construído uma vez por dataset: para cada dimensão, os códigos
+# inteiros de cada linha e as posições das linhas de cada valor (índice invertido).
+# A seleção de uma dimensão vira um bitmap compactado (np.packbits), guardado em cache,
+# e um filtro com várias dimensões é a interseção (AND bit a bit) desses bitmaps
+class FilterIndex:
+    def __init__(self, df, dims=DIMENSION_COLUMNS):
+        self.n = len(df)
+        position_dtype = np.int32 if self.n < np.iinfo(np.int32).max else np.int64
+        self.codes = {}
+        self.values = {}
+        self.positions = {}
+        self.boundaries = {}
+        for col in dims:
+            if col not in df.columns:
+                continue
+            # Categorias já trazem códigos prontos; as demais colunas são fatoradas
+            if isinstance(df[col].dtype, pd.CategoricalDtype):
+                codes = df[col].cat.codes.to_numpy()
+                uniques = df[col].cat.categories
+            else:
+                codes, uniques = pd.factorize(df[col], sort=False)
+                codes = codes.astype(np.int32)
+            order = np.argsort(codes, kind='stable').astype(position_dtype)
+            self.codes[col] = codes
+            self.values[col] = {value: i for i, value in enumerate(uniques)}
+            self.positions[col] = order
+            self.boundaries[col] = np.searchsorted(codes[order], np.arange(-1, len(uniques) + 1))
+        self._bitmaps = BoundedLRU(FILTER_BITMAP_CACHE_MAX_ENTRIES)
+
+    # Valores presentes da dimensão, na ordem das categorias ou de aparição no dataset
+    def options(self, col):
+        sizes = np.diff(self.boundaries[col])[1:]
+        return [value for value, i in self.values[col].items() if sizes[i] > 0]
+
+    # Bitmap compactado das linhas cujo valor está na seleção; None quando a seleção
+    # inclui todas as linhas e a dimensão não restringe o filtro
+    def bitmap(self, col, selected):
+        key = (col, frozenset(selected))
+        cached = self._bitmaps.get(key, False)
+        if cached is not False:
+            return cached
+        ids = sorted({self.values[col][value] for value in selected if value in self.values[col]})
+        boundaries = self.boundaries[col]
+        sizes = np.diff(boundaries)[1:]
+        selected_rows = int(sizes[ids].sum()) if ids else 0
+        if selected_rows == self.n:
+            bits = None
+        elif selected_rows * 8 < self.n:
+            # Seleção esparsa: marca diretamente as posições do índice invertido
+            mask = np.zeros(self.n, dtype=bool)
+            for i in ids:
+                mask[self.positions[col][boundaries[i + 1]:boundaries[i + 2]]] = True
+            bits = np.packbits(mask)
+        else:
+            # Seleção densa: tabela de consulta indexada pelos códigos (-1 = ausente)
+            lookup = np.zeros(len(sizes) + 1, dtype=bool)
+            lookup[ids] = True
+            bits = np.packbits(lookup[self.codes[col]])
+        self._bitmaps.put(key, bits)
+        return bits
+
+    # Posições das linhas que atendem a todas as seleções {dimensão: valores};
+    # None significa todas as linhas
+    def select(self, selections):
+        bitmaps = [self.bitmap(col, values) for col, values in selections.items()]
+        bitmaps = [bits for bits in bitmaps if bits is not None]
+        if not bitmaps:
+            return None
+        combined = bitmaps[0] if len(bitmaps) == 1 else np.bitwise_and.reduce(bitmaps)
+        return np.flatnonzero(np.unpackbits(combined, count=self.n))
+
+# Configurações da ingestão em blocos
+CSV_CHUNK_ROWS = 200_000
+STREAM_SAMPLE_ROWS = 50_000
+
+# Resumo incremental de um CSV lido em blocos: contagens, valores ausentes, células do
+# cubo de agregação e uma amostra de reservatório de tamanho fixo (quantis e prévia).
+# A memória usada depende do tamanho do bloco, da amostra e da cardinalidade das
+# dimensões, e não do tamanho do arquivo
+class StreamingSummary:
+    def __init__(self, sample_size=STREAM_SAMPLE_ROWS, seed=0):
+        self.sample_size = sample_size
+        self.rows = 0
+        self.missing = None
+        self.preview = None
+        self.sample = None
+        self.integer_values = True
+        self.outlier_detectors = {group: IQROutlierDetector(group_by=group) for group in OUTLIER_GROUP_OPTIONS.values()}
+        self._cells = None
+        self._cube = None
+        self._rng = np.random.default_rng(seed)
+
+    def update(self, chunk):
+        if 'Vendas (litros)' in chunk.columns:
+            chunk['Vendas (litros)'] = pd.to_numeric(chunk['Vendas (litros)'], errors='coerce')
+        missing = chunk.isnull().sum()
+        self.missing = missing if self.missing is None else self.missing.add(missing, fill_value=0).astype('int64')
+        if self.preview is None:
+            self.preview = chunk.head(10).copy()
+        if 'Vendas (litros)' in chunk.columns:
+            values = chunk['Vendas (litros)'].dropna().to_numpy()
+            self.integer_values = self.integer_values and bool(np.all(np.mod(values, 1) == 0))
+            cells = AggregationCube.build_cells(chunk)
+            self._cells = cells if self._cells is None else AggregationCube.merge_cells(self._cells, cells)
+            for group, detector in self.outlier_detectors.items():
+                if group is None or group in chunk.columns:
+                    detector.update(chunk)
+        self._update_sample(chunk)
+        self.rows += len(chunk)
+        self._cube = None
+
+    # Amostragem de reservatório (algoritmo R) vetorizada por bloco: a linha global i
+    # substitui uma posição aleatória da amostra com probabilidade k / (i + 1)
+    def _update_sample(self, chunk):
+        k = self.sample_size
+        positions = np.arange(self.rows, self.rows + len(chunk))
+        fill = positions < k
+        if fill.any():
+            head = chunk[fill]
+            self.sample = head.reset_index(drop=True) if self.sample is None else pd.concat([self.sample, head], ignore_index=True)
+        if fill.all():
+            return
+        candidates = chunk[~fill]
+        slots = self._rng.integers(0, positions[~fill] + 1)
+        accepted = np.flatnonzero(slots < k)
+        if len(accepted) == 0:
+            return
+        # Quando a mesma posição é sorteada mais de uma vez, vale a última substituição
+        reversed_slots = slots[accepted][::-1]
+        unique_slots, first_in_reversed = np.unique(reversed_slots, return_index=True)
+        winners = accepted[::-1][first_in_reversed]
+        combined = pd.concat([self.sample, candidates.iloc[winners]], ignore_index=True)
+        take = np.arange(k)
+        take[unique_slots] = k + np.arange(len(winners))
+        self.sample = combined.take(take).reset_index(drop=True)
+
+    def quantiles(self, probabilities=(0.25, 0.5, 0.75)):
+        sketch = self.outlier_detectors[None].sketches.get(None, KLLSketch())
+        return pd.Series(sketch.quantile(probabilities), index=list(probabilities), name='Vendas (litros)')
+
+    def outlier_bounds(self, group=None):
+        return self.outlier_detectors[group].bounds()
+
+    def estimated_outliers(self, group=None):
+        return self.outlier_detectors[group].estimated_outliers()
+
+    # Finaliza a leitura: amostra limpa e cubo com os agregados exatos do arquivo inteiro
+    def finalize(self):
+        if self.sample is not None:
+            self.sample = clean_sales_table(self.sample)
+        return self
+
+    def to_cube(self):
+        if self._cube is None:
+            cells = self._cells.copy()
+            for col in DIMENSION_COLUMNS:
+                if col in cells.columns:
+                    cells[col] = to_ordered_category(cells[col], col)
+            medians = {}
+            for group in CUBE_MEDIAN_DIMENSIONS:
+                detector = self.outlier_detectors.get(group[0]) if len(group) == 1 else None
+                if detector is not None and detector.sketches:
+                    medians[group] = pd.Series({key: sketch.quantile(0.5)[0] for key, sketch in detector.sketches.items()})
+            dims = [col for col in DIMENSION_COLUMNS if col in cells.columns]
+            self._cube = AggregationCube(cells, dims, self.integer_values, self.quantiles(), medians)
+        return self._cube
+
+# Lê o CSV em blocos de chunksize linhas, mantendo em memória apenas o resumo incremental
+def stream_sales_table(file, chunksize=CSV_CHUNK_ROWS, read_options=CSV_READ_OPTIONS, sample_size=STREAM_SAMPLE_ROWS):
+    summary = StreamingSummary(sample_size)
+    with pd.read_csv(file, chunksize=chunksize, **read_options) as reader:
+        for chunk in reader:
+            summary.update(chunk)
+    return summary.finalize()
+
+# Estatísticas descritivas gerais, por marca, por estação e por localidade, consolidadas do cubo
+def cube_stats(cube):
+    stats = cube.describe()
+    
+    # Estatísticas por marca
+    brand_stats = cube.rollup(['Marca'])[['Marca', 'mean', 'median', 'std', 'sum']]
+    brand_stats.columns = ['Marca', 'Média', 'Mediana', 'Desvio Padrão', 'Total']
+    
+    # Estatísticas por estação
+    season_stats = cube.rollup(['Estação'])[['Estação', 'mean', 'median', 'std', 'sum']]
+    season_stats.columns = ['Estação', 'Média', 'Mediana', 'Desvio Padrão', 'Total']
+    
+    # Estatísticas por cidade e bairro
+    location_stats = cube.rollup(['Cidade', 'Bairro'])[['Cidade', 'Bairro', 'mean', 'sum']]
+    location_stats.columns = ['Cidade', 'Bairro', 'Média', 'Total']
+    
+    return stats, brand_stats, season_stats, location_stats
+
+# Configurações da redução de pontos enviados ao navegador
+HISTOGRAM_BINS = 20
+SCATTER_POINT_BUDGET = 2000
+
+# Histograma calculado com np.histogram: o navegador recebe só as barras, não os valores
+def histogram_frame(values, bins=HISTOGRAM_BINS):
+    values = values[~np.isnan(values)]
+    counts, edges = np.histogram(values, bins=bins)
+    return pd.DataFrame({
+        'Vendas (litros)': (edges[:-1] + edges[1:]) / 2,
+        'count': counts,
+        'Início': edges[:-1],
+        'Fim': edges[1:]
+    })
+
+# Índices escolhidos pelo Largest-Triangle-Three-Buckets (LTTB): os pontos, ordenados
+# por x, são divididos em budget - 2 baldes e de cada balde fica o ponto que forma o
+# maior triângulo com o ponto escolhido antes e a média do balde seguinte
+def lttb_indices(x, y, budget):
+    n = len(x)
+    if budget >= n or budget < 3:
+        return np.arange(n)
+    order = np.argsort(x, kind='stable')
+    xs, ys = x[order], y[order]
+    edges = np.linspace(1, n - 1, budget - 1).astype(np.int64)
+    selected = np.empty(budget, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    previous = 0
+    for i in range(budget - 2):
+        start, end = edges[i], max(edges[i + 1], edges[i] + 1)
+        next_start, next_end = (edges[i + 1], edges[i + 2]) if i + 2 < len(edges) else (n - 1, n)
+        next_x = xs[next_start:max(next_end, next_start + 1)].mean()
+        next_y = ys[next_start:max(next_end, next_start + 1)].mean()
+        area = np.abs(
+            (xs[previous] - next_x) * (ys[start:end] - ys[previous])
+            - (xs[previous] - xs[start:end]) * (next_y - ys[previous])
+        )
+        previous = start + int(np.argmax(area))
+        selected[i + 1] = previous
+    return order[selected]
+
+# Reduz um gráfico de dispersão ao orçamento de pontos com LTTB, dividindo o orçamento
+# entre os grupos de cor proporcionalmente ao tamanho de cada um
+def downsample_scatter(df, x, y, budget=SCATTER_POINT_BUDGET, color=None):
+    df = df[df[x].notna() & df[y].notna()]
+    if len(df) <= budget:
+        return df
+    groups = [(None, np.arange(len(df)))] if color is None else [
+        (key, positions) for key, positions in df.groupby(color, observed=True, sort=False).indices.items()
+    ]
+    selected = []
+    for _, positions in groups:
+        share = max(3, int(budget * len(positions) / len(df)))
+        xs = df[x].to_numpy(dtype=np.float64)[positions]
+        ys = df[y].to_numpy(dtype=np.float64)[positions]
+        selected.append(positions[lttb_indices(xs, ys, share)])
+    return df.iloc[np.sort(np.concatenate(selected))]
+
+# Configurações da simulação climática
+CLIMATE_SEASON_TEMPERATURES = {'Verão': 30, 'Outono': 22, 'Inverno': 15, 'Primavera': 25}
+CLIMATE_TEMPERATURE_STD = 2
+CLIMATE_SEED = 42
+CLIMATE_BIN_WIDTH = 1.0
+
+# Temperaturas simuladas para cada linha em uma única chamada NumPy: média da estação
+# mais ruído normal, com semente fixa para que o resultado se repita entre reruns
+def simulate_temperatures(seasons, seed=CLIMATE_SEED, std=CLIMATE_TEMPERATURE_STD):
+    codes, uniques = pd.factorize(seasons)
+    means = np.array([CLIMATE_SEASON_TEMPERATURES.get(season, np.nan) for season in uniques] + [np.nan])
+    rng = np.random.default_rng(seed)
+    return means[codes] + rng.normal(0, std, size=len(codes))
+
+# Média de vendas por faixa de temperatura (largura bin_width em °C), agregada com bincount
+def bin_temperatures(temperatures, values, bin_width=CLIMATE_BIN_WIDTH):
+    valid = ~np.isnan(temperatures) & ~np.isnan(values)
+    if not valid.any():
+        return pd.DataFrame(columns=['Temperatura', 'Vendas (litros)', 'Registros'])
+    bins = np.floor(temperatures[valid] / bin_width).astype(np.int64)
+    offset = bins.min()
+    counts = np.bincount(bins - offset)
+    sums = np.bincount(bins - offset, weights=values[valid])
+    observed = np.flatnonzero(counts)
+    return pd.DataFrame({
+        'Temperatura': (observed + offset + 0.5) * bin_width,
+        'Vendas (litros)': sums[observed] / counts[observed],
+        'Registros': counts[observed]
+    })
+
+# Configurações da regressão linear das retas de tendência
+REGRESSION_CONFIDENCE = 0.95
+REGRESSION_BAND_POINTS = 50
+REGRESSION_SUM_COLUMNS = ['n', 'sum_x', 'sum_y', 'sum_xy', 'sum_xx', 'sum_yy']
+
+# Quantil da distribuição t de Student com dof graus de liberdade: exato para 1 e 2 graus
+# e, acima disso, expansão de Cornish-Fisher a partir do quantil normal
+def t_quantile(p, dof):
+    from statistics import NormalDist
+    if dof == 1:
+        return float(np.tan(np.pi * (p - 0.5)))
+    if dof == 2:
+        return (2 * p - 1) / np.sqrt(2 * p * (1 - p))
+    z = NormalDist().inv_cdf(p)
+    return (z + (z ** 3 + z) / (4 * dof)
+            + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * dof ** 2)
+            + (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / (384 * dof ** 3))
+
+# Regressão linear simples (mínimos quadrados) a partir de estatísticas suficientes: n, Σx,
+# Σy, Σxy, Σx² e Σy² (esta para o R²), mais o menor e o maior x. As somas podem ser
+# acumuladas bloco a bloco e combinadas entre partições com merge; a reta, o R² e a banda
+# de confiança saem delas sem reajustar sobre as linhas
+class RegressionStats:
+    def __init__(self, n=0, sum_x=0.0, sum_y=0.0, sum_xy=0.0, sum_xx=0.0, sum_yy=0.0,
+                 x_min=float('inf'), x_max=float('-inf')):
+        self.n = int(n)
+        self.sum_x = float(sum_x)
+        self.sum_y = float(sum_y)
+        self.sum_xy = float(sum_xy)
+        self.sum_xx = float(sum_xx)
+        self.sum_yy = float(sum_yy)
+        self.x_min = float(x_min)
+        self.x_max = float(x_max)
+
+    @classmethod
+    def from_arrays(cls, x, y):
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        valid = ~np.isnan(x) & ~np.isnan(y)
+        x, y = x[valid], y[valid]
+        if len(x) == 0:
+            return cls()
+        return cls(len(x), x.sum(), y.sum(), x @ y, x @ x, y @ y, x.min(), x.max())
+
+    # Estatísticas de cada grupo em uma única passada (bincount), com os grupos dados por
+    # códigos de 0 a n_groups - 1 (negativos são ignorados)
+    @classmethod
+    def by_group(cls, x, y, codes, n_groups):
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        codes = np.asarray(codes)
+        valid = ~np.isnan(x) & ~np.isnan(y) & (codes >= 0)
+        x, y, codes = x[valid], y[valid], codes[valid].astype(np.int64)
+        counts = np.bincount(codes, minlength=n_groups)
+        sums = [np.bincount(codes, weights=w, minlength=n_groups) for w in (x, y, x * y, x * x, y * y)]
+        x_min = np.full(n_groups, np.inf)
+        x_max = np.full(n_groups, -np.inf)
+        np.minimum.at(x_min, codes, x)
+        np.maximum.at(x_max, codes, x)
+        return [cls(counts[i], *(s[i] for s in sums), x_min[i], x_max[i]) for i in range(n_groups)]
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(*(row[col] for col in REGRESSION_SUM_COLUMNS), row['x_min'], row['x_max'])
+
+    def merge(self, other):
+        return RegressionStats(
+            self.n + other.n,
+            self.sum_x + other.sum_x,
+            self.sum_y + other.sum_y,
+            self.sum_xy + other.sum_xy,
+            self.sum_xx + other.sum_xx,
+            self.sum_yy + other.sum_yy,
+            min(self.x_min, other.x_min),
+            max(self.x_max, other.x_max)
+        )
+
+    # Somas centradas: Sxx, Sxy e Syy
+    def centered(self):
+        if self.n == 0:
+            return 0.0, 0.0, 0.0
+        return (
+            self.sum_xx - self.sum_x * self.sum_x / self.n,
+            self.sum_xy - self.sum_x * self.sum_y / self.n,
+            self.sum_yy - self.sum_y * self.sum_y / self.n
+        )
+
+    # Inclinação e intercepto; NaN com menos de dois pontos ou x constante
+    def coefficients(self):
+        sxx, sxy, _ = self.centered()
+        if self.n < 2 or sxx <= 0:
+            return float('nan'), float('nan')
+        slope = sxy / sxx
+        return slope, (self.sum_y - slope * self.sum_x) / self.n
+
+    def r_squared(self):
+        sxx, sxy, syy = self.centered()
+        if self.n < 2 or sxx <= 0 or syy <= 0:
+            return float('nan')
+        return min(sxy * sxy / (sxx * syy), 1.0)
+
+    def predict(self, x):
+        slope, intercept = self.coefficients()
+        return intercept + slope * np.asarray(x, dtype=np.float64)
+
+    # Limites inferior e superior da banda de confiança da reta (média de y dado x)
+    def band(self, x, confidence=REGRESSION_CONFIDENCE):
+        x = np.asarray(x, dtype=np.float64)
+        fitted = self.predict(x)
+        sxx, sxy, syy = self.centered()
+        if self.n < 3 or sxx <= 0:
+            return fitted, fitted
+        residual_variance = max(syy - sxy * sxy / sxx, 0.0) / (self.n - 2)
+        mean_x = self.sum_x / self.n
+        margin = t_quantile(0.5 + confidence / 2, self.n - 2) * np.sqrt(
+            residual_variance * (1 / self.n + (x - mean_x) ** 2 / sxx)
+        )
+        return fitted - margin, fitted + margin
+
+# Tabela de retas ajustadas, uma linha por série (coluna label_column), com as estatísticas
+# suficientes (para recombinar séries ou partições) e os coeficientes já calculados
+def regression_table(fits, label_column):
+    rows = []
+    for label, fit in fits.items():
+        slope, intercept = fit.coefficients()
+        rows.append(dict(
+            {label_column: label},
+            **{col: getattr(fit, col) for col in REGRESSION_SUM_COLUMNS},
+            x_min=fit.x_min,
+            x_max=fit.x_max,
+            slope=slope,
+            intercept=intercept,
+            r_squared=fit.r_squared()
+        ))
+    return pd.DataFrame(rows, columns=[label_column] + REGRESSION_SUM_COLUMNS + ['x_min', 'x_max', 'slope', 'intercept', 'r_squared'])
+
+# Postos médios (empates recebem a média das posições) e o tamanho de cada grupo de
+# empates, para a correção do Kruskal-Wallis
+def average_ranks(values):
+    order = np.argsort(values)
+    sorted_values = values[order]
+    group_ids = np.cumsum(np.r_[True, sorted_values[1:] != sorted_values[:-1]]) - 1
+    ties = np.bincount(group_ids)
+    ranks = np.empty(len(values))
+    ranks[order] = (np.cumsum(ties) - (ties - 1) / 2)[group_ids]
+    return ranks, ties
+
+# Probabilidade de cauda da qui-quadrado com dof inteiro, pela forma fechada da função
+# gama incompleta: soma de termos de Poisson (dof par) ou erfc mais a soma (dof ímpar),
+# com os termos calculados em escala logarítmica
+def chi2_sf(x, dof):
+    if dof <= 0 or np.isnan(x):
+        return float('nan')
+    if x <= 0:
+        return 1.0
+    half = x / 2
+    if dof % 2 == 0:
+        i = np.arange(dof // 2)
+        log_gamma = np.concatenate([[0.0], np.cumsum(np.log(np.arange(1, dof // 2)))])
+        return float(min(np.exp(-half + i * np.log(half) - log_gamma).sum(), 1.0))
+    i = np.arange(1, (dof + 1) // 2) - 0.5
+    log_gamma = math.lgamma(0.5) + np.cumsum(np.log(i))
+    return float(min(math.erfc(math.sqrt(half)) + np.exp(-half + i * np.log(half) - log_gamma).sum(), 1.0))
+
+# Força de associação entre as dimensões e as vendas e entre cada par de dimensões, a partir
+# dos códigos inteiros das categorias: eta² (ANOVA) e H de Kruskal-Wallis de cada dimensão
+# com as vendas, e V de Cramér entre as dimensões. Os códigos e os postos são calculados uma
+# vez, e cada estatística sai de contagens e somas por grupo (np.bincount) ou das células
+# observadas de cada par (np.unique), de modo que tempo e memória crescem com as linhas e as
+# combinações presentes nos dados, não com o produto das cardinalidades
+def association_tables(df, value_col='Vendas (litros)'):
+    dims = [col for col in DIMENSION_COLUMNS if col in df.columns]
+    codes = {}
+    for col in dims:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            codes[col] = (df[col].cat.codes.to_numpy(), len(df[col].cat.categories))
+        else:
+            col_codes, uniques = pd.factorize(df[col])
+            codes[col] = (col_codes, len(uniques))
+    
+    rows = []
+    if value_col in df.columns:
+        values = df[value_col].to_numpy(dtype=np.float64, na_value=np.nan)
+        has_value = ~np.isnan(values)
+        all_ranks = None
+        for col in dims:
+            col_codes, k = codes[col]
+            valid = has_value & (col_codes >= 0)
+            y, groups = values[valid], col_codes[valid]
+            n = len(y)
+            counts = np.bincount(groups, minlength=k)
+            observed = counts > 0
+            eta_squared = h = p_value = float('nan')
+            if n > 1:
+                sums = np.bincount(groups, weights=y, minlength=k)
+                total_ss = y @ y - y.sum() ** 2 / n
+                between_ss = (sums[observed] ** 2 / counts[observed]).sum() - y.sum() ** 2 / n
+                if total_ss > 0:
+                    eta_squared = min(max(between_ss / total_ss, 0.0), 1.0)
+                
+                # Postos de todas as linhas válidas, reaproveitados pelas dimensões sem ausentes
+                if (valid == has_value).all():
+                    if all_ranks is None:
+                        all_ranks = average_ranks(values[has_value])
+                    ranks, ties = all_ranks
+                else:
+                    ranks, ties = average_ranks(y)
+                # Em ponto flutuante: com milhões de empates, ties ** 3 estoura o int64
+                ties = ties.astype(np.float64)
+                tie_correction = 1 - (ties ** 3 - ties).sum() / (float(n) ** 3 - n)
+                if tie_correction > 0 and observed.sum() > 1:
+                    rank_sums = np.bincount(groups, weights=ranks, minlength=k)[observed]
+                    h = (12 / (n * (n + 1)) * (rank_sums ** 2 / counts[observed]).sum() - 3 * (n + 1)) / tie_correction
+                    p_value = chi2_sf(h, observed.sum() - 1)
+            rows.append({
+                'Dimensão': col,
+                'Categorias': int(observed.sum()),
+                'Eta²': eta_squared,
+                'H (Kruskal-Wallis)': h,
+                'p-valor': p_value
+            })
+    sales_association = pd.DataFrame(rows, columns=['Dimensão', 'Categorias', 'Eta²', 'H (Kruskal-Wallis)', 'p-valor'])
+    
+    # V de Cramér de cada par, só com as células observadas da tabela de contingência. Quando
+    # a tabela não tem mais células que linhas, as contagens saem de um bincount sobre o código
+    # combinado; quando teria, de np.unique, com os totais de linha e coluna de um bincount de
+    # cada dimensão. Como as células vazias não contribuem, qui² = n(Σ O²/(LC) - 1)
+    cramers_v = np.eye(len(dims))
+    for i, a in enumerate(dims):
+        for j in range(i + 1, len(dims)):
+            b = dims[j]
+            (codes_a, k_a), (codes_b, k_b) = codes[a], codes[b]
+            valid = (codes_a >= 0) & (codes_b >= 0)
+            valid_a, valid_b = codes_a[valid].astype(np.int64), codes_b[valid]
+            n = len(valid_a)
+            combined = valid_a * k_b + valid_b
+            if k_a * k_b <= n:
+                table = np.bincount(combined, minlength=k_a * k_b)
+                row_totals = table.reshape(k_a, k_b).sum(axis=1)
+                col_totals = table.reshape(k_a, k_b).sum(axis=0)
+                cells = np.flatnonzero(table)
+                observed_cells = table[cells]
+            else:
+                cells, observed_cells = np.unique(combined, return_counts=True)
+                row_totals = np.bincount(valid_a, minlength=k_a)
+                col_totals = np.bincount(valid_b, minlength=k_b)
+            r = min(np.count_nonzero(row_totals), np.count_nonzero(col_totals)) - 1
+            value = float('nan')
+            if n > 0 and r > 0:
+                expected = row_totals[cells // k_b].astype(np.float64) * col_totals[cells % k_b]
+                chi2 = n * ((observed_cells.astype(np.float64) ** 2 / expected).sum() - 1)
+                value = float(np.sqrt(max(chi2, 0.0) / (n * r)))
+            cramers_v[i, j] = cramers_v[j, i] = value
+    cramers_v = pd.DataFrame(cramers_v, columns=dims)
+    cramers_v.insert(0, 'Dimensão', dims)
+    
+    return {'sales_association': sales_association, 'cramers_v': cramers_v}
+
+# Tabelas de correlação entre as dimensões e as vendas, mais a simulação climática.
+# As médias vêm do cubo; sem cubo, ele é construído a partir de df
+def correlation_tables(df, cube=None, bin_width=CLIMATE_BIN_WIDTH, seed=CLIMATE_SEED, progress=None):
+    correlations = {}
+    
+    if 'Vendas (litros)' in df.columns:
+        if cube is None:
+            cube = AggregationCube.build(df)
+        
+        # Correlação entre marca e vendas
+        brand_corr = cube.rollup(['Marca'])[['Marca', 'mean']].rename(columns={'mean': 'Vendas (litros)'})
+        brand_corr = brand_corr.sort_values('Vendas (litros)', ascending=False)
+        
+        # Correlação entre estação e vendas
+        season_corr = cube.rollup(['Estação'])[['Estação', 'mean']].rename(columns={'mean': 'Vendas (litros)'})
+        season_corr = season_corr.set_index('Estação').reindex(SEASON_ORDER).reset_index()
+        
+        # Correlação entre localidade e vendas
+        location_corr = cube.rollup(['Cidade', 'Bairro'])[['Cidade', 'Bairro', 'mean']].rename(columns={'mean': 'Vendas (litros)'})
+        location_corr = location_corr.sort_values('Vendas (litros)', ascending=False)
+        
+        # Correlação entre marca e estação
+        brand_season_corr = cube.rollup(['Marca', 'Estação']).pivot(
+            index='Marca',
+            columns='Estação',
+            values='mean'
+        ).reset_index()
+        
+        correlations['brand'] = brand_corr
+        correlations['season'] = season_corr
+        correlations['location'] = location_corr
+        correlations['brand_season'] = brand_season_corr
+        
+        if progress is not None:
+            progress(0.5, "simulando temperaturas")
+        
+        # Simulação de dados climáticos
+        # Criando uma relação simulada entre estação e temperatura média
+        temperatures = simulate_temperatures(df['Estação'], seed=seed)
+        df_climate = pd.DataFrame({
+            'Estação': df['Estação'].to_numpy(),
+            'Marca': df['Marca'].to_numpy(),
+            'Vendas (litros)': df['Vendas (litros)'].to_numpy(),
+            'Temperatura': temperatures
+        })
+        
+        # Correlação entre temperatura e vendas, por faixa de temperatura
+        sales = df['Vendas (litros)'].to_numpy(dtype=np.float64, na_value=np.nan)
+        climate_corr = bin_temperatures(temperatures, sales, bin_width)
+        
+        # Retas de tendência: sobre as médias das faixas (os pontos do gráfico) e, para
+        # cada marca, sobre todas as linhas
+        climate_fit = RegressionStats.from_arrays(climate_corr['Temperatura'], climate_corr['Vendas (litros)'])
+        brand_codes, brands = pd.factorize(df['Marca'], sort=True)
+        brand_fits = RegressionStats.by_group(temperatures, sales, brand_codes, len(brands))
+        
+        correlations['climate'] = climate_corr
+        correlations['climate_trend'] = regression_table({'Todas': climate_fit}, 'Série')
+        correlations['brand_trends'] = regression_table(dict(zip(brands, brand_fits)), 'Marca')
+        correlations['df_climate'] = df_climate
+        
+        # Força de associação das dimensões com as vendas e entre si
+        correlations.update(association_tables(df))
+    
+    return correlations
+
+# Configurações do resumo enviado ao ChatGPT
+SUMMARY_TOKEN_BUDGET = 1200
+SUMMARY_TOP_K = 10
+SUMMARY_TOKENIZER_MODEL = "gpt-3.5-turbo"
+
+# Contagem de tokens do prompt: usa o tokenizador do modelo quando o tiktoken está
+# instalado e, sem ele, a aproximação de quatro caracteres por token. O tokenizador é
+# carregado na primeira contagem (False quando não está disponível)
+_token_encoding = None
+
+def count_tokens(text):
+    global _token_encoding
+    if _token_encoding is None:
+        try:
+            import tiktoken
+            _token_encoding = tiktoken.encoding_for_model(SUMMARY_TOKENIZER_MODEL)
+        except Exception:
+            _token_encoding = False
+    if _token_encoding:
+        return len(_token_encoding.encode(text))
+    return -(-len(text) // 4)
+
+# Lista de valores limitada aos primeiros itens, indicando quantos ficaram de fora
+def format_top_values(values, limit):
+    values = [str(value) for value in values]
+    text = ', '.join(values[:limit])
+    if len(values) > limit:
+        text += f" (e mais {len(values) - limit})"
+    return text
+
+# Resumo dos dados para o ChatGPT, montado por seções em ordem de prioridade a partir das
+# estatísticas já calculadas; cada seção entra com o maior número de itens (até top_k) que
+# ainda cabe no orçamento de tokens, de modo que o tamanho do prompt não cresce com a
+# cardinalidade de bairros, cidades ou marcas
+def build_data_summary(n_rows, stats, brand_stats, season_stats, location_stats,
+                       token_budget=SUMMARY_TOKEN_BUDGET, top_k=SUMMARY_TOP_K):
+    brands = brand_stats.sort_values('Total', ascending=False)
+    locations = location_stats.sort_values('Total', ascending=False)
+    cities = locations.groupby('Cidade', observed=True, sort=False)['Total'].sum().sort_values(ascending=False)
+    neighborhoods = locations.groupby('Bairro', observed=True, sort=False)['Total'].sum().sort_values(ascending=False)
+    
+    sections = [f"""
+    Resumo dos dados de vendas de cerveja:
+    
+    Estatísticas gerais:
+    - Total de registros: {n_rows}
+    - Média de vendas: {stats['mean']:.2f} litros
+    - Mediana de vendas: {stats['50%']:.2f} litros
+    - Desvio padrão: {stats['std']:.2f} litros
+    - Mínimo: {stats['min']:.2f} litros
+    - Máximo: {stats['max']:.2f} litros
+    """]
+    used = count_tokens(sections[0])
+    
+    candidates = [
+        (lambda k: f"""
+    Vendas por estação (total):
+    {season_stats[['Estação', 'Total']].to_string(index=False)}
+    """, 1),
+        (lambda k: f"""
+    Top {k} marcas por vendas totais:
+    {brands.head(k)[['Marca', 'Total']].to_string(index=False)}
+    """, min(top_k, len(brands))),
+        (lambda k: f"""
+    Top {k} localidades por vendas totais:
+    {locations.head(k)[['Cidade', 'Bairro', 'Total']].to_string(index=False)}
+    """, min(top_k, len(locations))),
+        (lambda k: f"""
+    Marcas presentes ({len(brands)}): {format_top_values(brands['Marca'], k)}
+    Cidades presentes ({len(cities)}): {format_top_values(cities.index, k)}
+    Estações do ano: {', '.join(str(season) for season in season_stats['Estação'])}
+    """, top_k),
+        (lambda k: f"""
+    Bairros presentes ({len(neighborhoods)}): {format_top_values(neighborhoods.index, k)}
+    """, top_k)
+    ]
+    for render, max_k in candidates:
+        for k in range(max_k, 0, -1):
+            text = render(k)
+            cost = count_tokens(text)
+            if used + cost <= token_budget:
+                sections.append(text)
+                used += cost
+                break
+    
+    return "".join(sections)
+
+# Configurações das chamadas ao ChatGPT
+LLM_MODEL = "gpt-3.5-turbo"
+LLM_MAX_TOKENS = 1000
+
+# Cache persistente (SQLite) de respostas do modelo, indexado pelo hash do prompt, do
+# modelo e de max_tokens, com validade (TTL) e despejo das entradas menos acessadas
+class LLMResponseCache:
+    def __init__(self, path, ttl, max_entries):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, model TEXT, response TEXT, "
+                "created_at REAL, last_access REAL)"
+            )
+
+    @staticmethod
+    def make_key(prompt, model, max_tokens):
+        payload = json.dumps([model, max_tokens, prompt], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT response FROM responses WHERE key = ? AND created_at >= ?",
+                (key, now - self.ttl)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, model, response):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, model, response, now, now)
+            )
+            self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+# Envia o prompt ao modelo em streaming, consultando antes o cache de respostas: devolve os
+# trechos de texto à medida que o modelo os gera e, ao final, grava a resposta no cache e
+# registra em metrics o tempo até o primeiro token e a latência total. Respostas em cache
+# são devolvidas de uma só vez. O cliente pode ser qualquer objeto com
+# chat.completions.create (o módulo openai ou um stub local)
+def stream_prompt(prompt, client, cache=None, metrics=None, model=LLM_MODEL, max_tokens=LLM_MAX_TOKENS):
+    start = time.perf_counter()
+    key = LLMResponseCache.make_key(prompt, model, max_tokens)
+    cached = cache.get(key) if cache is not None else None
+    if cached is not None:
+        elapsed = time.perf_counter() - start
+        if metrics is not None:
+            metrics.append({'Modelo': model, 'Cache': True, 'Primeiro Token (s)': elapsed, 'Total (s)': elapsed, 'Caracteres': len(cached)})
+        yield cached
+        return
+    stream = client.chat.completions.create(
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+        max_tokens=max_tokens,
+        stream=True
+    )
+    parts = []
+    first_token = None
+    for chunk in stream:
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if delta:
+            if first_token is None:
+                first_token = time.perf_counter() - start
+            parts.append(delta)
+            yield delta
+    content = "".join(parts)
+    if cache is not None and content:
+        cache.put(key, model, content)
+    if metrics is not None:
+        total = time.perf_counter() - start
+        metrics.append({
+            'Modelo': model,
+            'Cache': False,
+            'Primeiro Token (s)': total if first_token is None else first_token,
+            'Total (s)': total,
+            'Caracteres': len(content)
+        })
+
+# Configurações do modo em lote (perguntas pré-definidas em paralelo)
+LLM_BATCH_CONCURRENCY = 5
+LLM_BATCH_TIMEOUT = 60
+LLM_BATCH_RETRIES = 2
+LLM_BATCH_BACKOFF = 1.0
+
+# Erros que não adianta repetir: chave, permissão ou requisição inválidas. É uma função
+# para que o módulo openai só seja importado quando uma pergunta for de fato enviada
+def llm_permanent_errors():
+    return (openai.AuthenticationError, openai.PermissionDeniedError, openai.BadRequestError)
+
+# Envia o prompt ao modelo de forma assíncrona, consultando antes o cache de respostas,
+# com limite de concorrência (semáforo), tempo limite por tentativa e novas tentativas com
+# espera exponencial e jitter
+async def complete_prompt_async(prompt, client, semaphore, cache=None, model=LLM_MODEL, max_tokens=LLM_MAX_TOKENS,
+                                timeout=LLM_BATCH_TIMEOUT, retries=LLM_BATCH_RETRIES, backoff=LLM_BATCH_BACKOFF):
+    key = LLMResponseCache.make_key(prompt, model, max_tokens)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+    async with semaphore:
+        for attempt in range(retries + 1):
+            try:
+                response = await asyncio.wait_for(
+                    client.chat.completions.create(
+                        model=model,
+                        messages=[{"role": "user", "content": prompt}],
+                        max_tokens=max_tokens
+                    ),
+                    timeout
+                )
+                break
+            except llm_permanent_errors():
+                raise
+            except Exception:
+                if attempt == retries:
+                    raise
+                await asyncio.sleep(backoff * 2 ** attempt * (1 + random.random()))
+    content = response.choices[0].message.content
+    if cache is not None and content:
+        cache.put(key, model, content)
+    return content
+
+# Configurações da instrumentação das etapas
+PROFILE_MAX_RECORDS = 500
+PROFILE_METRIC_PREFIX = "vendas_cerveja_step"
+
+# Instrumentação leve das etapas do pipeline: cada medição registra o tempo de relógio,
+# as linhas processadas e, com trace_memory, o pico de memória alocada durante a chamada
+# (tracemalloc). Guarda as últimas max_records medições e totais acumulados por etapa,
+# exportáveis em JSON lines ou no formato de texto do Prometheus; com log_path, cada
+# medição também é acrescentada a um arquivo JSON lines. O tracemalloc vale para o
+# processo inteiro: com sessões simultâneas, o pico inclui as alocações das demais
+class StepProfiler:
+    def __init__(self, max_records=PROFILE_MAX_RECORDS, trace_memory=False, log_path=None):
+        self.records = deque(maxlen=max_records)
+        self.totals = {}
+        self.log_path = log_path
+        self.trace_memory = False
+        self._started_tracing = False
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.set_trace_memory(trace_memory)
+
+    def set_trace_memory(self, enabled):
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        elif not enabled and self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        self.trace_memory = enabled
+
+    # Pilha de medições abertas na thread atual: [memória no início, maior pico das internas]
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextmanager
+    def measure(self, step, rows=None):
+        record = {'step': step, 'timestamp': time.time(), 'seconds': None, 'rows': rows, 'peak_bytes': None, 'status': 'ok'}
+        stack = self._stack()
+        frame = None
+        if self.trace_memory and tracemalloc.is_tracing():
+            # O pico é reiniciado a cada medição; o da medição externa é preservado na pilha
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1][1] = max(stack[-1][1], peak)
+            tracemalloc.reset_peak()
+            frame = [current, current]
+            stack.append(frame)
+        start = time.perf_counter()
+        try:
+            yield record
+        except BaseException:
+            record['status'] = 'error'
+            raise
+        finally:
+            record['seconds'] = time.perf_counter() - start
+            if frame is not None:
+                stack.pop()
+                peak = max(tracemalloc.get_traced_memory()[1], frame[1])
+                record['peak_bytes'] = max(peak - frame[0], 0)
+                if stack:
+                    stack[-1][1] = max(stack[-1][1], peak)
+            self._add(record)
+
+    # Decorador: mede cada chamada da função; rows(args, resultado) devolve as linhas
+    # processadas. Em funções geradoras a medição cobre o consumo do gerador
+    def profile(self, step, rows=None):
+        def decorate(func):
+            if inspect.isgeneratorfunction(func):
+                @functools.wraps(func)
+                def generator_wrapper(*args, **kwargs):
+                    with self.measure(step, rows(args, None) if rows is not None else None):
+                        yield from func(*args, **kwargs)
+                return generator_wrapper
+            
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.measure(step) as record:
+                    result = func(*args, **kwargs)
+                    if rows is not None:
+                        record['rows'] = rows(args, result)
+                    return result
+            return wrapper
+        return decorate
+
+    def _add(self, record):
+        with self._lock:
+            self.records.append(record)
+            totals = self.totals.setdefault(record['step'], {'count': 0, 'seconds': 0.0, 'rows': 0, 'errors': 0, 'max_peak_bytes': 0})
+            totals['count'] += 1
+            totals['seconds'] += record['seconds']
+            totals['rows'] += record['rows'] or 0
+            totals['errors'] += record['status'] != 'ok'
+            totals['max_peak_bytes'] = max(totals['max_peak_bytes'], record['peak_bytes'] or 0)
+            if self.log_path:
+                try:
+                    with open(self.log_path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(record) + "\n")
+                except OSError:
+                    pass
+
+    def clear(self):
+        with self._lock:
+            self.records.clear()
+            self.totals.clear()
+
+    def recent(self, limit=20):
+        with self._lock:
+            return list(self.records)[-limit:][::-1]
+
+    # Totais acumulados por etapa, com mediana e percentil 95 das medições guardadas
+    def summary(self):
+        with self._lock:
+            records = list(self.records)
+            totals = {step: dict(total) for step, total in self.totals.items()}
+        rows = []
+        for step, total in totals.items():
+            durations = [record['seconds'] for record in records if record['step'] == step]
+            p50, p95 = np.quantile(durations, [0.5, 0.95]) if durations else (np.nan, np.nan)
+            rows.append({
+                'step': step,
+                'count': total['count'],
+                'total_seconds': total['seconds'],
+                'mean_seconds': total['seconds'] / total['count'],
+                'p50_seconds': float(p50),
+                'p95_seconds': float(p95),
+                'max_seconds': max(durations) if durations else np.nan,
+                'rows': total['rows'],
+                'errors': total['errors'],
+                'max_peak_bytes': total['max_peak_bytes']
+            })
+        return rows
+
+    def to_json_lines(self):
+        with self._lock:
+            return "".join(json.dumps(record) + "\n" for record in self.records)
+
+    # Formato de exposição em texto do Prometheus: resumo das durações, contadores de
+    # linhas e erros e o maior pico de memória por etapa
+    def to_prometheus(self, prefix=PROFILE_METRIC_PREFIX):
+        summary = self.summary()
+        lines = [
+            f"# HELP {prefix}_duration_seconds Tempo de relógio das etapas instrumentadas.",
+            f"# TYPE {prefix}_duration_seconds summary"
+        ]
+        for row in summary:
+            label = f'step="{row["step"]}"'
+            lines.append(f'{prefix}_duration_seconds{{{label},quantile="0.5"}} {row["p50_seconds"]}')
+            lines.append(f'{prefix}_duration_seconds{{{label},quantile="0.95"}} {row["p95_seconds"]}')
+            lines.append(f'{prefix}_duration_seconds_sum{{{label}}} {row["total_seconds"]}')
+            lines.append(f'{prefix}_duration_seconds_count{{{label}}} {row["count"]}')
+        for metric, key, kind, help_text in [
+            ('rows_total', 'rows', 'counter', 'Linhas processadas pelas etapas instrumentadas.'),
+            ('errors_total', 'errors', 'counter', 'Chamadas das etapas que terminaram com erro.'),
+            ('peak_memory_bytes', 'max_peak_bytes', 'gauge', 'Maior pico de memória alocada (tracemalloc) por etapa.')
+        ]:
+            lines.append(f"# HELP {prefix}_{metric} {help_text}")
+            lines.append(f"# TYPE {prefix}_{metric} {kind}")
+            for row in summary:
+                lines.append(f'{prefix}_{metric}{{step="{row["step"]}"}} {row[key]}')
+        return "\n".join(lines) + "\n"
+
+# Configurações das tarefas em segundo plano
+JOB_THREAD_WORKERS = 4
+JOB_PROCESS_WORKERS = 2
+JOB_HISTORY_MAX_ENTRIES = 32
+JOB_BACKENDS = ("thread", "process")
+
+class JobCancelled(Exception):
+    pass
+
+# Tarefa em segundo plano identificada por uma chave (por exemplo, versão do dataset e
+# etapa). Com o backend de threads, a função recebe progress=job.report e pode informar
+# o andamento (fração de 0 a 1, mensagem e resultados parciais, acumulados em
+# job.partial); report também é o ponto de cancelamento, pois
+# levanta JobCancelled quando o cancelamento foi pedido. Tarefas em processos só informam
+# início e fim, e o cancelamento de uma tarefa já iniciada descarta o resultado
+class Job:
+    def __init__(self, key, backend):
+        self.key = key
+        self.backend = backend
+        self.progress = 0.0
+        self.message = ""
+        self.partial = []
+        self.result = None
+        self.error = None
+        self.submitted = time.time()
+        self.finished = None
+        self.owners = set()
+        self.future = None
+        self._status = "pending"
+        self._cancel = threading.Event()
+
+    @property
+    def status(self):
+        if self._status == "pending" and self.future is not None and self.future.running():
+            return "running"
+        return self._status
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    def done(self):
+        return self._status in ("done", "failed", "cancelled")
+
+    def elapsed(self):
+        return (self.finished or time.time()) - self.submitted
+
+    def report(self, progress, message=None, partial=None):
+        if self._cancel.is_set():
+            raise JobCancelled(self.key)
+        if partial is not None:
+            self.partial.append(partial)
+        self.progress = min(max(float(progress), 0.0), 1.0)
+        if message is not None:
+            self.message = message
+
+# Executor de tarefas em segundo plano com pools de threads e de processos, criados no
+# primeiro uso. Uma tarefa já pendente, em andamento ou concluída com a mesma chave é
+# reaproveitada em vez de executada de novo. Cada interessado (owner) segura a tarefa;
+# quando o último a libera, uma tarefa ainda em andamento é cancelada e uma concluída é
+# descartada. Até history tarefas concluídas sem interessados ficam guardadas
+class JobExecutor:
+    def __init__(self, thread_workers=JOB_THREAD_WORKERS, process_workers=JOB_PROCESS_WORKERS,
+                 history=JOB_HISTORY_MAX_ENTRIES):
+        self.thread_workers = thread_workers
+        self.process_workers = process_workers
+        self.history = history
+        self._threads = None
+        self._processes = None
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _pool(self, backend):
+        if backend == "process":
+            if self._processes is None:
+                self._processes = ProcessPoolExecutor(max_workers=self.process_workers)
+            return self._processes
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(max_workers=self.thread_workers, thread_name_prefix="job")
+        return self._threads
+
+    # Submete fn(*args, **kwargs) com a chave key, ou devolve a tarefa que já existe.
+    # Tarefas que falharam ou foram canceladas são submetidas de novo
+    def submit(self, key, fn, *args, backend="thread", owner=None, progress=False, **kwargs):
+        if backend not in JOB_BACKENDS:
+            raise ValueError(f"backend desconhecido: {backend}")
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None or job.status in ("failed", "cancelled"):
+                job = Job(key, backend)
+                self._jobs[key] = job
+                if backend == "process":
+                    job.future = self._pool(backend).submit(fn, *args, **kwargs)
+                else:
+                    job.future = self._pool(backend).submit(self._run, job, fn, args, kwargs, progress)
+                job.future.add_done_callback(functools.partial(self._finish, job))
+                self._evict()
+            self._jobs.move_to_end(key)
+            if owner is not None:
+                job.owners.add(owner)
+        return job
+
+    @staticmethod
+    def _run(job, fn, args, kwargs, progress):
+        if job.cancel_requested:
+            raise JobCancelled(job.key)
+        job._status = "running"
+        if progress:
+            kwargs = dict(kwargs, progress=job.report)
+        return fn(*args, **kwargs)
+
+    @staticmethod
+    def _finish(job, future):
+        if job.done():
+            return
+        if future.cancelled() or job.cancel_requested:
+            job._status = "cancelled"
+        elif future.exception() is not None:
+            error = future.exception()
+            job._status = "cancelled" if isinstance(error, JobCancelled) else "failed"
+            job.error = error
+        else:
+            job.result = future.result()
+            job.progress = 1.0
+            job._status = "done"
+        job.finished = time.time()
+
+    def get(self, key):
+        with self._lock:
+            return self._jobs.get(key)
+
+    # Libera a tarefa em nome de owner; sem owner, o cancelamento é forçado
+    def release(self, key, owner=None):
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None:
+                return
+            job.owners.discard(owner)
+            if owner is not None and job.owners:
+                return
+            if job.done():
+                del self._jobs[key]
+                return
+            job._cancel.set()
+        job.future.cancel()
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    # Descarta as tarefas concluídas mais antigas sem interessados além do histórico
+    def _evict(self):
+        idle = [key for key, job in self._jobs.items() if job.done() and not job.owners]
+        for key in idle[:max(len(idle) - self.history, 0)]:
+            del self._jobs[key]
+
+    def shutdown(self, cancel=True):
+        for job in self.jobs():
+            if not job.done():
+                job._cancel.set()
+        for pool in (self._threads, self._processes):
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=cancel)
+
+# Configurações do processamento em lote
+BATCH_FILE_PATTERN = "*.csv"
+BATCH_MANIFEST_NAME = "manifest.json"
+
+# Converte tabelas e séries do pandas em estruturas JSON (NaN vira null)
+def to_json_data(data):
+    if data is None:
+        return None
+    orient = 'records' if isinstance(data, pd.DataFrame) else 'index'
+    return json.loads(data.to_json(orient=orient, force_ascii=False))
+
+# Executa o pipeline completo para um CSV e grava em output_dir/<nome do arquivo>:
+# aggregates.parquet (células do cubo), outliers.parquet e summary.json (estatísticas,
+# limites de outliers, correlações e o resumo de texto). Com chunksize, o arquivo é lido
+# em blocos e os outliers são marcados numa segunda passada, sem carregá-lo inteiro
+def analyze_file(path, output_dir, chunksize=None, outlier_group=None, bin_width=CLIMATE_BIN_WIDTH,
+                 token_budget=SUMMARY_TOKEN_BUDGET):
+    start = time.perf_counter()
+    target = os.path.join(output_dir, os.path.splitext(os.path.basename(path))[0])
+    
+    if chunksize:
+        streamed = stream_sales_table(path, chunksize)
+        df, rows, missing = streamed.sample, streamed.rows, streamed.missing
+        if df is None or 'Vendas (litros)' not in df.columns:
+            raise ValueError("coluna 'Vendas (litros)' ausente")
+        cube = streamed.to_cube()
+        detector = streamed.outlier_detectors[outlier_group]
+        outlier_bounds = detector.bounds()
+        flagged = []
+        with pd.read_csv(path, chunksize=chunksize, **CSV_READ_OPTIONS) as reader:
+            for chunk in reader:
+                flagged.append(chunk[detector.flag(chunk)])
+        outliers = clean_sales_table(pd.concat(flagged, ignore_index=True))
+    else:
+        df = read_sales_table(path)
+        if 'Vendas (litros)' not in df.columns:
+            raise ValueError("coluna 'Vendas (litros)' ausente")
+        df, missing, _, outliers, _, outlier_bounds = preprocess_data(df, outlier_group)
+        rows = len(df)
+        cube = AggregationCube.build(df)
+    
+    stats, brand_stats, season_stats, location_stats = cube_stats(cube)
+    correlations = correlation_tables(df, cube, bin_width)
+    data_summary = build_data_summary(rows, stats, brand_stats, season_stats, location_stats, token_budget)
+    
+    os.makedirs(target, exist_ok=True)
+    cube.cells.to_parquet(os.path.join(target, 'aggregates.parquet'), index=False)
+    outliers.to_parquet(os.path.join(target, 'outliers.parquet'), index=False)
+    result = {
+        'source': os.path.abspath(path),
+        'output': os.path.abspath(target),
+        'rows': int(rows),
+        'outliers': len(outliers),
+        'seconds': round(time.perf_counter() - start, 3)
+    }
+    report = dict(
+        result,
+        missing_values=to_json_data(missing),
+        stats=to_json_data(stats),
+        brand_stats=to_json_data(brand_stats),
+        season_stats=to_json_data(season_stats),
+        location_stats=to_json_data(location_stats),
+        outlier_bounds=to_json_data(outlier_bounds),
+        correlations={name: to_json_data(table) for name, table in correlations.items() if name != 'df_climate'},
+        data_summary=data_summary
+    )
+    with open(os.path.join(target, 'summary.json'), 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return result
+
+# Processa os CSVs do diretório em paralelo, um arquivo por tarefa em até workers processos,
+# e grava o manifest.json com o resultado ou o erro de cada arquivo. on_result(resultado)
+# é chamado na ordem em que os arquivos terminam
+def run_batch(input_dir, output_dir, workers=None, pattern=BATCH_FILE_PATTERN, on_result=None, **options):
+    paths = sorted(glob.glob(os.path.join(input_dir, pattern)))
+    os.makedirs(output_dir, exist_ok=True)
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(analyze_file, path, output_dir, **options): path for path in paths}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {'source': os.path.abspath(futures[future]), 'error': f"{type(e).__name__}: {e}"}
+            results.append(result)
+            if on_result is not None:
+                on_result(result)
+    results.sort(key=lambda result: result['source'])
+    with open(os.path.join(output_dir, BATCH_MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    return results
+
+# Linha de comando: python analysis_engine.py <diretório de CSVs> <diretório de saída>
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Análise em lote de arquivos CSV de vendas de cerveja")
+    parser.add_argument("input_dir", help="diretório com os arquivos CSV")
+    parser.add_argument("output_dir", help="diretório onde os resultados serão gravados")
+    parser.add_argument("--workers", type=int, default=None, help="número de processos (padrão: núcleos da CPU)")
+    parser.add_argument("--pattern", default=BATCH_FILE_PATTERN, help="padrão dos arquivos de entrada")
+    parser.add_argument("--chunksize", type=int, default=None, help="lê cada arquivo em blocos deste número de linhas")
+    parser.add_argument("--outlier-group", choices=[group for group in OUTLIER_GROUP_OPTIONS.values() if group],
+                        default=None, help="calcula os limites de outliers por grupo")
+    parser.add_argument("--bin-width", type=float, default=CLIMATE_BIN_WIDTH, help="largura das faixas de temperatura (°C)")
+    parser.add_argument("--token-budget", type=int, default=SUMMARY_TOKEN_BUDGET, help="orçamento de tokens do resumo")
+    args = parser.parse_args(argv)
+    
+    def report(result):
+        name = os.path.basename(result['source'])
+        if 'error' in result:
+            print(f"{name}: ERRO - {result['error']}", file=sys.stderr)
+        else:
+            print(f"{name}: {result['rows']} linhas, {result['outliers']} outliers em {result['seconds']:.2f}s")
+    
+    start = time.perf_counter()
+    results = run_batch(
+        args.input_dir,
+        args.output_dir,
+        workers=args.workers,
+        pattern=args.pattern,
+        on_result=report,
+        chunksize=args.chunksize,
+        outlier_group=args.outlier_group,
+        bin_width=args.bin_width,
+        token_budget=args.token_budget
+    )
+    failures = sum('error' in result for result in results)
+    print(f"{len(results)} arquivos processados em {time.perf_counter() - start:.2f}s ({failures} com erro)")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,29 @@
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-import numpy as np
-import openai
 import os
-import json
+import asyncio
+import hashlib
+import threading
+import time
+import weakref
+from collections import OrderedDict
 from datetime import datetime
+from analysis_engine import (
+    LazyModule, StepProfiler, SEASON_ORDER, CSV_READ_OPTIONS, OUTLIER_GROUP_OPTIONS, CSV_CHUNK_ROWS, STREAM_SAMPLE_ROWS,
+    HISTOGRAM_BINS, SCATTER_POINT_BUDGET, CLIMATE_BIN_WIDTH, CLIMATE_SEED, REGRESSION_BAND_POINTS,
+    SUMMARY_TOKEN_BUDGET, SUMMARY_TOP_K, LLM_BATCH_CONCURRENCY,
+    IngestionCache, LLMResponseCache, BoundedLRU, AggregationCube, FilterIndex, JobExecutor, RegressionStats,
+    content_fingerprint, read_sales_table, stream_sales_table, preprocess_data, cube_stats,
+    histogram_frame, downsample_scatter, correlation_tables, count_tokens, build_data_summary,
+    stream_prompt, complete_prompt_async
+)
+
+# Bibliotecas pesadas carregadas apenas no primeiro uso, pela etapa que precisa delas
+pd = LazyModule("pandas")
+np = LazyModule("numpy")
+px = LazyModule("plotly.express")
+go = LazyModule("plotly.graph_objects")
+pio = LazyModule("plotly.io")
+openai = LazyModule("openai")
 
 # Configuração da página
 st.set_page_config(
@@ -80,10 +97,141 @@ if 'data' not in st.session_state:
     st.session_state.data = None
 if 'api_key_valid' not in st.session_state:
     st.session_state.api_key_valid = False
+if 'api_key' not in st.session_state:
+    st.session_state.api_key = None
 if 'current_step' not in st.session_state:
     st.session_state.current_step = 1
 if 'insights' not in st.session_state:
     st.session_state.insights = None
+if 'stream_summary' not in st.session_state:
+    st.session_state.stream_summary = None
+if 'llm_metrics' not in st.session_state:
+    st.session_state.llm_metrics = []
+if 'jobs' not in st.session_state:
+    st.session_state.jobs = {}
+if 'cancelled_jobs' not in st.session_state:
+    st.session_state.cancelled_jobs = set()
+if 'job_owner' not in st.session_state:
+    st.session_state.job_owner = os.urandom(8).hex()
+if 'insights_job' not in st.session_state:
+    st.session_state.insights_job = None
+
+# Configurações do perfil de desempenho; PROFILE_LOG_PATH grava cada medição em JSON lines
+PROFILE_TRACE_MEMORY = False
+PROFILE_LOG_PATH = os.environ.get("PROFILE_LOG_PATH")
+
+# Perfilador único do servidor, compartilhado por todas as sessões
+@st.cache_resource
+def get_profiler():
+    return StepProfiler(trace_memory=PROFILE_TRACE_MEMORY, log_path=PROFILE_LOG_PATH)
+
+# Linhas processadas: tamanho do resultado ou do primeiro argumento da função medida
+def result_rows(args, result):
+    return None if result is None else len(result)
+
+def input_rows(args, result):
+    return len(args[0]) if args and args[0] is not None else None
+
+# Painel de desempenho: tempos por etapa, medições recentes e exportação
+def show_profiling_panel():
+    profiler = get_profiler()
+    trace_memory = st.checkbox(
+        "Medir pico de memória (tracemalloc)",
+        value=profiler.trace_memory,
+        help="Vale para todo o servidor e deixa as etapas mais lentas enquanto ativo."
+    )
+    if trace_memory != profiler.trace_memory:
+        profiler.set_trace_memory(trace_memory)
+    
+    summary = profiler.summary()
+    if not summary:
+        st.caption("Nenhuma medição registrada ainda.")
+        return
+    
+    summary_df = pd.DataFrame(summary)
+    summary_df['max_peak_bytes'] = summary_df['max_peak_bytes'] / 1024 ** 2
+    st.dataframe(
+        summary_df[['step', 'count', 'mean_seconds', 'p95_seconds', 'rows', 'max_peak_bytes']].rename(columns={
+            'step': 'Etapa',
+            'count': 'Chamadas',
+            'mean_seconds': 'Média (s)',
+            'p95_seconds': 'P95 (s)',
+            'rows': 'Linhas',
+            'max_peak_bytes': 'Pico (MB)'
+        }),
+        hide_index=True
+    )
+    
+    recent = pd.DataFrame(profiler.recent())
+    recent['timestamp'] = pd.to_datetime(recent['timestamp'], unit='s').dt.strftime('%H:%M:%S')
+    recent['peak_bytes'] = recent['peak_bytes'] / 1024 ** 2
+    st.caption("Medições recentes")
+    st.dataframe(
+        recent[['timestamp', 'step', 'seconds', 'rows', 'peak_bytes', 'status']].rename(columns={
+            'timestamp': 'Hora',
+            'step': 'Etapa',
+            'seconds': 'Tempo (s)',
+            'rows': 'Linhas',
+            'peak_bytes': 'Pico (MB)',
+            'status': 'Status'
+        }),
+        hide_index=True
+    )
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button("JSON lines", profiler.to_json_lines(), file_name="perfil_etapas.jsonl", mime="application/json")
+    with col2:
+        st.download_button("Prometheus", profiler.to_prometheus(), file_name="perfil_etapas.prom", mime="text/plain")
+    if st.button("Limpar medições"):
+        profiler.clear()
+
+# Configurações da validação da chave API
+API_KEY_VALIDATION_TTL = 15 * 60
+API_KEY_VALIDATION_ERROR_TTL = 30
+API_KEY_VALIDATION_TIMEOUT = 10
+API_KEY_VALIDATION_MAX_ENTRIES = 256
+
+# Verificação local do formato da chave, feita antes de qualquer chamada à API
+def api_key_format_ok(api_key):
+    return api_key.startswith("sk-") and len(api_key) >= 20 and not any(c.isspace() for c in api_key)
+
+# Hash da chave, que a identifica em caches e chaves de tarefas sem guardá-la
+def api_key_hash(api_key):
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+# Validador de chaves com cache por hash da chave e validade (TTL), limitado às
+# max_entries chaves usadas mais recentemente. A verificação remota lista os modelos,
+# chamada que não consome tokens; erros transitórios (rede, limite de requisições) ficam
+# em cache apenas por error_ttl segundos
+class ApiKeyValidator:
+    def __init__(self, ttl, error_ttl, max_entries):
+        self.ttl = ttl
+        self.error_ttl = error_ttl
+        self._results = BoundedLRU(max_entries)
+
+    def validate(self, api_key):
+        key_hash = api_key_hash(api_key)
+        now = time.monotonic()
+        cached = self._results.get(key_hash)
+        if cached is not None and now < cached[2]:
+            return cached[0], cached[1]
+        if not api_key_format_ok(api_key):
+            valid, message, ttl = False, "formato de chave não reconhecido", self.ttl
+        else:
+            try:
+                openai.OpenAI(api_key=api_key, timeout=API_KEY_VALIDATION_TIMEOUT, max_retries=0).models.list()
+                valid, message, ttl = True, "", self.ttl
+            except (openai.AuthenticationError, openai.PermissionDeniedError) as e:
+                valid, message, ttl = False, str(e), self.ttl
+            except Exception as e:
+                valid, message, ttl = False, str(e), self.error_ttl
+        self._results.put(key_hash, (valid, message, now + ttl))
+        return valid, message
+
+@st.cache_resource
+def get_api_key_validator():
+    return ApiKeyValidator(API_KEY_VALIDATION_TTL, API_KEY_VALIDATION_ERROR_TTL, API_KEY_VALIDATION_MAX_ENTRIES)
 
 # Barra lateral para navegação e configurações
 with st.sidebar:
@@ -91,22 +239,17 @@ with st.sidebar:
     
     # Chave API do ChatGPT
     api_key = st.text_input("Chave API do ChatGPT", type="password")
+    st.session_state.api_key = api_key or None
     
     if api_key:
-        # Validar a chave API
-        try:
-            openai.api_key = api_key
-            # Teste simples para verificar se a chave é válida
-            response = openai.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": "Olá"}],
-                max_tokens=5
-            )
-            st.session_state.api_key_valid = True
+        # Validar a chave API (resultado reaproveitado entre reruns)
+        openai.api_key = api_key
+        valid, message = get_api_key_validator().validate(api_key)
+        st.session_state.api_key_valid = valid
+        if valid:
             st.success("✅ Chave API válida!")
-        except Exception as e:
-            st.session_state.api_key_valid = False
-            st.error(f"❌ Chave API inválida: {str(e)}")
+        else:
+            st.error(f"❌ Chave API inválida: {message}")
     
     # Etapas do processo
     st.markdown("### Etapas do Processo")
@@ -124,13 +267,18 @@ with st.sidebar:
         if st.button(step, key=f"step_{i}"):
             st.session_state.current_step = i
 
-# Função para chamar a API do ChatGPT
-def get_chatgpt_insights(data_summary, question):
-    if not st.session_state.api_key_valid:
-        return "Por favor, insira uma chave API válida do ChatGPT para gerar insights."
-    
-    try:
-        prompt = f"""
+# Configurações do cache de respostas do ChatGPT
+LLM_CACHE_PATH = os.path.join(".cache", "llm_responses.sqlite3")
+LLM_CACHE_TTL = 7 * 24 * 60 * 60
+LLM_CACHE_MAX_ENTRIES = 5000
+
+@st.cache_resource
+def get_llm_response_cache():
+    return LLMResponseCache(LLM_CACHE_PATH, LLM_CACHE_TTL, LLM_CACHE_MAX_ENTRIES)
+
+# Prompt enviado ao ChatGPT para uma pergunta sobre o resumo dos dados
+def build_insights_prompt(data_summary, question):
+    return f"""
         Você é um analista de dados especializado em vendas de cerveja. Com base nos seguintes dados:
         
         {data_summary}
@@ -140,83 +288,505 @@ def get_chatgpt_insights(data_summary, question):
         Forneça uma análise detalhada com insights estratégicos e recomendações práticas. 
         Organize sua resposta em tópicos claros e inclua sugestões específicas para otimização de vendas.
         """
-        
-        response = openai.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=1000
-        )
-        
-        return response.choices[0].message.content
+
+# Envia todas as perguntas ao mesmo tempo e chama on_result(i, pergunta, resposta) na
+# ordem em que as respostas chegam; erros de uma pergunta não interrompem as demais. Sem
+# cliente, um é criado com api_key (ou a chave global do módulo openai)
+async def ask_questions_async(data_summary, questions, on_result=None, client=None, cache=None,
+                              concurrency=LLM_BATCH_CONCURRENCY, api_key=None):
+    own_client = client is None
+    if own_client:
+        client = openai.AsyncOpenAI(api_key=api_key or openai.api_key, max_retries=0)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def ask(i, question):
+        try:
+            answer = await complete_prompt_async(build_insights_prompt(data_summary, question), client, semaphore, cache)
+        except Exception as e:
+            answer = f"Erro ao chamar a API do ChatGPT: {str(e) or type(e).__name__}"
+        return i, question, answer
+
+    answers = [None] * len(questions)
+    try:
+        for finished in asyncio.as_completed([ask(i, question) for i, question in enumerate(questions)]):
+            i, question, answer = await finished
+            answers[i] = answer
+            if on_result is not None:
+                on_result(i, question, answer)
+    finally:
+        if own_client:
+            await client.close()
+    return answers
+
+# Envia as perguntas em uma tarefa em segundo plano, com a chave da sessão que a criou:
+# cada resposta é informada ao progresso assim que chega, e o cancelamento interrompe as
+# perguntas que ainda não foram respondidas
+def ask_questions_in_background(data_summary, questions, api_key, cache=None, progress=None):
+    answered = []
+    
+    def on_result(i, question, answer):
+        answered.append(i)
+        if progress is not None:
+            progress(len(answered) / len(questions), f"{len(answered)} de {len(questions)} respostas", (i, answer))
+    
+    return asyncio.run(ask_questions_async(data_summary, questions, on_result, cache=cache, api_key=api_key))
+
+LLM_METRICS_MAX_ENTRIES = 100
+
+# Função para chamar a API do ChatGPT com a resposta em streaming
+@get_profiler().profile("stream_chatgpt_insights")
+def stream_chatgpt_insights(data_summary, question, client=None):
+    if not st.session_state.api_key_valid:
+        yield "Por favor, insira uma chave API válida do ChatGPT para gerar insights."
+        return
+    
+    metrics = st.session_state.llm_metrics
+    try:
+        prompt = build_insights_prompt(data_summary, question)
+        yield from stream_prompt(prompt, client or openai, cache=get_llm_response_cache(), metrics=metrics)
     except Exception as e:
-        return f"Erro ao chamar a API do ChatGPT: {str(e)}"
+        yield f"Erro ao chamar a API do ChatGPT: {str(e)}"
+    del metrics[:-LLM_METRICS_MAX_ENTRIES]
+
+# Configurações do cache de ingestão
+INGESTION_CACHE_DIR = os.path.join(".cache", "ingestion")
+INGESTION_CACHE_MAX_MEMORY_BYTES = 512 * 1024 * 1024
+INGESTION_CACHE_MAX_DISK_BYTES = 2 * 1024 * 1024 * 1024
+
+# Registro de impressões digitais por objeto: o hash do conteúdo de cada DataFrame
+# é calculado uma única vez enquanto o objeto existir
+@st.cache_resource
+def get_fingerprint_registry():
+    return {}
+
+# Impressão digital do conteúdo do DataFrame (colunas, tipos e valores)
+def dataset_fingerprint(df):
+    registry = get_fingerprint_registry()
+    key = id(df)
+    entry = registry.get(key)
+    if entry is not None and entry[0]() is df:
+        return entry[1]
+    fingerprint = content_fingerprint(df)
+    registry[key] = (weakref.ref(df, lambda _: registry.pop(key, None)), fingerprint)
+    return fingerprint
+
+# Configurações do armazém de datasets e do registro de datasets da sessão
+DATASET_STORE_MAX_DERIVATIONS = 64
+DATASET_REGISTRY_MAX_VERSIONS = 6
+
+# Referência de uma sessão a um dataset do armazém compartilhado. O conteúdo é liberado
+# quando a referência é descartada, explicitamente com release() ou pela coleta de lixo
+# (por exemplo, quando a sessão termina e o seu estado é descartado)
+class DatasetHandle:
+    def __init__(self, store, version, df, kind):
+        self.version = version
+        self.df = df
+        self.kind = kind
+        self._finalizer = weakref.finalize(self, store.release, version)
+
+    def release(self):
+        self.df = None
+        self._finalizer()
+
+# Armazém de datasets do processo, compartilhado por todas as sessões: cada conteúdo
+# (versão) é guardado uma única vez e as sessões recebem referências (DatasetHandle) ao
+# mesmo objeto, que deve ser tratado como somente leitura. O conteúdo é descartado quando a
+# última referência é liberada, de modo que a memória cresce com o número de datasets
+# distintos e não com o número de usuários. As derivações (origem, etapa, parâmetros)
+# também são compartilhadas enquanto o dataset derivado estiver no armazém
+class SharedDatasetStore:
+    def __init__(self, max_derivations=DATASET_STORE_MAX_DERIVATIONS):
+        self.max_derivations = max_derivations
+        self.reused = 0
+        self._entries = {}
+        self._derivations = OrderedDict()
+        self._lock = threading.RLock()
+
+    # Devolve uma referência à versão; se o conteúdo já está no armazém, df é descartado
+    # em favor do objeto existente
+    def acquire(self, version, df, kind):
+        with self._lock:
+            entry = self._entries.get(version)
+            if entry is None:
+                entry = {'df': df, 'kind': kind, 'refs': 0, 'bytes': int(df.memory_usage(deep=True).sum())}
+                self._entries[version] = entry
+            elif entry['df'] is not df:
+                self.reused += 1
+            entry['refs'] += 1
+            return DatasetHandle(self, version, entry['df'], entry['kind'])
+
+    def release(self, version):
+        with self._lock:
+            entry = self._entries.get(version)
+            if entry is None:
+                return
+            entry['refs'] -= 1
+            if entry['refs'] <= 0:
+                del self._entries[version]
+                for key in [k for k, v in self._derivations.items() if v[0] == version or k[0] == version]:
+                    del self._derivations[key]
+
+    # Referência ao dataset derivado e seus artefatos, se a derivação já foi feita por
+    # alguma sessão e o resultado ainda está no armazém
+    def acquire_derivation(self, parent, step, params):
+        with self._lock:
+            entry = self._derivations.get((parent, step, params))
+            if entry is None or entry[0] not in self._entries:
+                return None
+            self._derivations.move_to_end((parent, step, params))
+            version, artifacts = entry
+            entry = self._entries[version]
+            return self.acquire(version, entry['df'], entry['kind']), artifacts
+
+    def add_derivation(self, parent, step, params, version, artifacts):
+        with self._lock:
+            self._derivations[(parent, step, params)] = (version, artifacts)
+            self._derivations.move_to_end((parent, step, params))
+            while len(self._derivations) > self.max_derivations:
+                self._derivations.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            entries = list(self._entries.values())
+        return {
+            "datasets": len(entries),
+            "references": sum(entry['refs'] for entry in entries),
+            "memory_bytes": sum(entry['bytes'] for entry in entries),
+            "shared_bytes": sum(entry['bytes'] * (entry['refs'] - 1) for entry in entries),
+            "reused": self.reused
+        }
+
+@st.cache_resource
+def get_dataset_store():
+    return SharedDatasetStore()
+
+# Registro de versões de datasets da sessão: cada dataset carregado ou limpo é identificado
+# por uma versão imutável (a impressão digital do conteúdo), que é também a chave dos caches
+# de cubo, estatísticas, correlações, figuras e resumos. Cada versão guarda a referência ao
+# dataset no armazém compartilhado, o tipo (bruto ou limpo) e a versão de origem; as
+# derivações (origem, etapa, parâmetros) já feitas são memorizadas com seus artefatos, de
+# modo que voltar a uma etapa não refaz o trabalho. Além de max_versions, as versões menos
+# usadas são liberadas, exceto a atual e as versões de que ela deriva
+class DatasetRegistry:
+    def __init__(self, store, max_versions=DATASET_REGISTRY_MAX_VERSIONS):
+        self.store = store
+        self.max_versions = max_versions
+        self.current = None
+        self._versions = OrderedDict()
+        self._derivations = {}
+
+    def add(self, version, df, kind, parent=None, stream_summary=None):
+        if version not in self._versions:
+            self._add_handle(self.store.acquire(version, df, kind), parent)
+        if stream_summary is not None:
+            self._versions[version]['stream_summary'] = stream_summary
+        self._versions.move_to_end(version)
+        self._evict()
+        return version
+
+    def _add_handle(self, handle, parent):
+        if handle.version in self._versions:
+            handle.release()
+        else:
+            self._versions[handle.version] = {'handle': handle, 'parent': parent, 'stream_summary': None}
+
+    def get(self, version):
+        entry = self._versions.get(version)
+        return None if entry is None else entry['handle'].df
+
+    # Versões da atual até a original, seguindo as origens
+    def lineage(self, version):
+        chain = []
+        while version in self._versions and version not in chain:
+            chain.append(version)
+            version = self._versions[version]['parent']
+        return chain
+
+    def root(self, version):
+        chain = self.lineage(version)
+        return chain[-1] if chain else None
+
+    # Resumo da leitura em blocos de que a versão deriva (None se o arquivo foi lido inteiro)
+    def stream_summary(self, version):
+        for v in self.lineage(version):
+            if self._versions[v]['stream_summary'] is not None:
+                return self._versions[v]['stream_summary']
+        return None
+
+    # Derivação já feita nesta sessão ou, na falta dela, por outra sessão do processo
+    def derivation(self, parent, step, params):
+        entry = self._derivations.get((parent, step, params))
+        if entry is not None and entry[0] in self._versions:
+            return entry
+        shared = self.store.acquire_derivation(parent, step, params)
+        if shared is None:
+            return None
+        handle, artifacts = shared
+        version = handle.version
+        self._add_handle(handle, parent)
+        self._derivations[(parent, step, params)] = (version, artifacts)
+        self._evict()
+        return version, artifacts
+
+    def add_derivation(self, parent, step, params, version, artifacts):
+        self._derivations[(parent, step, params)] = (version, artifacts)
+        self.store.add_derivation(parent, step, params, version, artifacts)
+
+    # Define a versão atual; devolve True quando ela mudou
+    def set_current(self, version):
+        changed = version != self.current
+        self.current = version
+        if version in self._versions:
+            self._versions.move_to_end(version)
+        return changed
+
+    def _evict(self):
+        protected = set(self.lineage(self.current))
+        for version in list(self._versions):
+            if len(self._versions) <= self.max_versions:
+                break
+            if version in protected:
+                continue
+            self._versions.pop(version)['handle'].release()
+            self._derivations = {
+                key: entry for key, entry in self._derivations.items()
+                if key[0] != version and entry[0] != version
+            }
+
+def get_dataset_registry():
+    if 'datasets' not in st.session_state:
+        st.session_state.datasets = DatasetRegistry(get_dataset_store())
+    return st.session_state.datasets
+
+# Versão do dataset atual da sessão; um dataset atribuído diretamente a
+# st.session_state.data é registrado como versão de origem e trocado pelo objeto do armazém
+def current_dataset_version():
+    registry = get_dataset_registry()
+    df = st.session_state.data
+    if registry.current is None or registry.get(registry.current) is not df:
+        registry.set_current(registry.add(dataset_fingerprint(df), df, 'raw'))
+        st.session_state.data = registry.get(registry.current)
+    return registry.current
+
+# Usa df como dataset de origem da sessão. Se o dataset atual já deriva dele (por exemplo,
+# a versão limpa da etapa 2), ele é mantido; a sessão só muda quando o conteúdo muda. Na
+# leitura em blocos, df é a amostra e o resumo fica junto da versão, de modo que ela e as
+# versões derivadas usam os agregados do arquivo inteiro
+def select_source_dataset(df, stream_summary=None):
+    registry = get_dataset_registry()
+    version = registry.add(dataset_fingerprint(df), df, 'raw', stream_summary=stream_summary)
+    if st.session_state.data is None or registry.root(current_dataset_version()) != version:
+        registry.set_current(version)
+        st.session_state.data = registry.get(version)
+        st.session_state.stream_summary = stream_summary
+    return version
+
+# Exibe a memória ocupada pelo armazém de datasets compartilhado entre as sessões
+def show_dataset_store_stats():
+    store_stats = get_dataset_store().stats()
+    st.caption(
+        f"Datasets compartilhados: {store_stats['datasets']} em memória "
+        f"({store_stats['memory_bytes'] / 1024 ** 2:.1f} MB) • "
+        f"{store_stats['references']} referências de sessões • "
+        f"{store_stats['shared_bytes'] / 1024 ** 2:.1f} MB poupados pelo compartilhamento"
+    )
+
+# Instância única do cache compartilhada por todas as sessões do servidor
+@st.cache_resource
+def get_ingestion_cache():
+    return IngestionCache(
+        INGESTION_CACHE_DIR,
+        INGESTION_CACHE_MAX_MEMORY_BYTES,
+        INGESTION_CACHE_MAX_DISK_BYTES
+    )
 
 # Função para carregar e processar o arquivo CSV
+@get_profiler().profile("load_data", rows=result_rows)
 def load_data(file):
     try:
-        df = pd.read_csv(file)
-        return df
+        return read_sales_table(file, get_ingestion_cache(), CSV_READ_OPTIONS)
     except Exception as e:
         st.error(f"Erro ao carregar o arquivo: {str(e)}")
         return None
 
-# Função para limpar e pré-processar os dados
-def preprocess_data(df):
-    # Cópia para não modificar o original
-    df_clean = df.copy()
-    
-    # Verificar valores ausentes
-    missing_values = df_clean.isnull().sum()
-    
-    # Verificar tipos de dados
-    dtypes = df_clean.dtypes
-    
-    # Converter colunas se necessário
-    if 'Vendas (litros)' in df_clean.columns:
-        df_clean['Vendas (litros)'] = pd.to_numeric(df_clean['Vendas (litros)'], errors='coerce')
-    
-    # Verificar outliers nas vendas
-    if 'Vendas (litros)' in df_clean.columns:
-        Q1 = df_clean['Vendas (litros)'].quantile(0.25)
-        Q3 = df_clean['Vendas (litros)'].quantile(0.75)
-        IQR = Q3 - Q1
-        lower_bound = Q1 - 1.5 * IQR
-        upper_bound = Q3 + 1.5 * IQR
-        outliers = df_clean[(df_clean['Vendas (litros)'] < lower_bound) | (df_clean['Vendas (litros)'] > upper_bound)]
-    else:
-        outliers = pd.DataFrame()
-    
-    return df_clean, missing_values, dtypes, outliers
+# Exibe os contadores de acertos e falhas do cache de ingestão
+def show_ingestion_cache_stats():
+    cache_stats = get_ingestion_cache().stats()
+    hits = cache_stats["memory_hits"] + cache_stats["disk_hits"]
+    st.caption(
+        f"Cache de ingestão: {hits} acertos "
+        f"({cache_stats['memory_hits']} memória, {cache_stats['disk_hits']} disco) • "
+        f"{cache_stats['misses']} falhas • "
+        f"{cache_stats['memory_bytes'] / 1024 ** 2:.1f} MB em memória"
+    )
+
+# Configurações do cubo de agregação
+CUBE_CACHE_MAX_ENTRIES = 16
+
+@st.cache_resource
+def get_cube_cache():
+    return BoundedLRU(CUBE_CACHE_MAX_ENTRIES)
+
+# Cubo do dataset, construído uma vez por versão (impressão digital) do conteúdo. Para
+# versões lidas em blocos, o cubo vem do resumo do arquivo inteiro guardado na versão,
+# nunca da amostra
+def get_aggregation_cube(df):
+    key = dataset_fingerprint(df)
+    summary = get_dataset_registry().stream_summary(key)
+    if summary is not None and summary.rows > 0:
+        return summary.to_cube()
+    cache = get_cube_cache()
+    cube = cache.get(key)
+    if cube is None:
+        cube = AggregationCube.build(df)
+        cache.put(key, cube)
+    return cube
+
+# Configurações do índice de filtros
+FILTER_INDEX_CACHE_MAX_ENTRIES = 8
+
+@st.cache_resource
+def get_filter_index_cache():
+    return BoundedLRU(FILTER_INDEX_CACHE_MAX_ENTRIES)
 
-# Função para gerar estatísticas descritivas
+def get_filter_index(df):
+    cache = get_filter_index_cache()
+    key = dataset_fingerprint(df)
+    index = cache.get(key)
+    if index is None:
+        index = FilterIndex(df)
+        cache.put(key, index)
+    return index
+
+# Configurações da ingestão em blocos
+STREAM_CACHE_MAX_ENTRIES = 8
+
+@st.cache_resource
+def get_stream_summary_cache():
+    return BoundedLRU(STREAM_CACHE_MAX_ENTRIES)
+
+# Função para carregar arquivos grandes em blocos, mantendo apenas o resumo em memória
+@get_profiler().profile("load_data_streaming", rows=lambda args, summary: None if summary is None else summary.rows)
+def load_data_streaming(file, chunksize=CSV_CHUNK_ROWS):
+    try:
+        cache = get_stream_summary_cache()
+        key = get_ingestion_cache().make_key(
+            get_ingestion_cache().content_hash(file),
+            dict(CSV_READ_OPTIONS, chunksize=chunksize, sample=STREAM_SAMPLE_ROWS)
+        )
+        summary = cache.get(key)
+        if summary is None:
+            if hasattr(file, "seek"):
+                file.seek(0)
+            summary = stream_sales_table(file, chunksize, CSV_READ_OPTIONS)
+            cache.put(key, summary)
+        return summary
+    except Exception as e:
+        st.error(f"Erro ao carregar o arquivo: {str(e)}")
+        return None
+
+# Configurações dos caches de estatísticas e correlações por versão do dataset
+STATS_CACHE_MAX_ENTRIES = 16
+CORRELATION_CACHE_MAX_ENTRIES = 8
+
+@st.cache_resource
+def get_stats_cache():
+    return BoundedLRU(STATS_CACHE_MAX_ENTRIES)
+
+@st.cache_resource
+def get_correlation_cache():
+    return BoundedLRU(CORRELATION_CACHE_MAX_ENTRIES)
+
+# Função para gerar estatísticas descritivas, calculadas uma vez por versão do dataset
+@get_profiler().profile("generate_stats", rows=input_rows)
 def generate_stats(df):
     if 'Vendas (litros)' in df.columns:
-        stats = df['Vendas (litros)'].describe()
-        
-        # Estatísticas por marca
-        brand_stats = df.groupby('Marca')['Vendas (litros)'].agg(['mean', 'median', 'std', 'sum']).reset_index()
-        brand_stats.columns = ['Marca', 'Média', 'Mediana', 'Desvio Padrão', 'Total']
-        
-        # Estatísticas por estação
-        season_stats = df.groupby('Estação')['Vendas (litros)'].agg(['mean', 'median', 'std', 'sum']).reset_index()
-        season_stats.columns = ['Estação', 'Média', 'Mediana', 'Desvio Padrão', 'Total']
-        
-        # Estatísticas por cidade e bairro
-        location_stats = df.groupby(['Cidade', 'Bairro'])['Vendas (litros)'].agg(['mean', 'sum']).reset_index()
-        location_stats.columns = ['Cidade', 'Bairro', 'Média', 'Total']
-        
-        return stats, brand_stats, season_stats, location_stats
+        cache = get_stats_cache()
+        key = dataset_fingerprint(df)
+        stats = cache.get(key)
+        if stats is None:
+            stats = cube_stats(get_aggregation_cube(df))
+            cache.put(key, stats)
+        return stats
     else:
         return None, None, None, None
 
+# Configurações do cache de figuras
+FIGURE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Cache LRU de conjuntos de figuras Plotly serializadas em JSON uma única vez,
+# limitado pelo tamanho total do JSON guardado
+class FigureCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def put(self, key, figures_json):
+        size = sum(len(value) for value in figures_json.values())
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (figures_json, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+@st.cache_resource
+def get_figure_cache():
+    return FigureCache(FIGURE_CACHE_MAX_BYTES)
+
+# Chave do cache: versão do dataset, conjunto de figuras, seleção de filtros
+# normalizada (ordem dos valores irrelevante) e parâmetros adicionais
+def figure_cache_key(df, name, selections=None, **params):
+    normalized = tuple(
+        (col, tuple(sorted(str(value) for value in values)))
+        for col, values in sorted((selections or {}).items())
+    )
+    return (dataset_fingerprint(df), name, normalized, tuple(sorted(params.items())))
+
+# Devolve as figuras do cache ou as constrói com build() e guarda seu JSON
+def get_cached_figures(key, build):
+    cache = get_figure_cache()
+    figures_json = cache.get(key)
+    if figures_json is None:
+        figures = build()
+        cache.put(key, {name: fig.to_json() for name, fig in figures.items()})
+        return figures
+    return {name: pio.from_json(value) for name, value in figures_json.items()}
+
 # Função para gerar visualizações
-def create_visualizations(df):
+@get_profiler().profile("create_visualizations", rows=input_rows)
+def create_visualizations(df, cube=None):
     visualizations = {}
     
     if 'Vendas (litros)' in df.columns:
+        if cube is None:
+            cube = get_aggregation_cube(df)
+        
         # Vendas por marca
         fig_brands = px.bar(
-            df.groupby('Marca')['Vendas (litros)'].sum().reset_index(),
+            cube.rollup(['Marca']).rename(columns={'sum': 'Vendas (litros)'}),
             x='Marca',
             y='Vendas (litros)',
             title='Vendas Totais por Marca',
@@ -227,19 +797,19 @@ def create_visualizations(df):
         
         # Vendas por estação
         fig_seasons = px.bar(
-            df.groupby('Estação')['Vendas (litros)'].sum().reset_index(),
+            cube.rollup(['Estação']).rename(columns={'sum': 'Vendas (litros)'}),
             x='Estação',
             y='Vendas (litros)',
             title='Vendas Totais por Estação',
             color='Estação',
-            category_orders={"Estação": ["Verão", "Outono", "Inverno", "Primavera"]},
+            category_orders={"Estação": SEASON_ORDER},
             template='plotly_white'
         )
         visualizations['seasons'] = fig_seasons
         
         # Vendas por cidade e bairro
         fig_locations = px.bar(
-            df.groupby(['Cidade', 'Bairro'])['Vendas (litros)'].sum().reset_index(),
+            cube.rollup(['Cidade', 'Bairro']).rename(columns={'sum': 'Vendas (litros)'}),
             x='Bairro',
             y='Vendas (litros)',
             color='Cidade',
@@ -251,81 +821,84 @@ def create_visualizations(df):
         
         # Vendas por marca e estação
         fig_brand_season = px.bar(
-            df.groupby(['Marca', 'Estação'])['Vendas (litros)'].sum().reset_index(),
+            cube.rollup(['Marca', 'Estação']).rename(columns={'sum': 'Vendas (litros)'}),
             x='Estação',
             y='Vendas (litros)',
             color='Marca',
             title='Vendas por Marca e Estação',
             barmode='group',
-            category_orders={"Estação": ["Verão", "Outono", "Inverno", "Primavera"]},
+            category_orders={"Estação": SEASON_ORDER},
             template='plotly_white'
         )
         visualizations['brand_season'] = fig_brand_season
         
-        # Distribuição das vendas
-        fig_dist = px.histogram(
-            df,
+        # Distribuição das vendas, com as faixas calculadas no servidor
+        histogram = histogram_frame(df['Vendas (litros)'].to_numpy(dtype=np.float64, na_value=np.nan), HISTOGRAM_BINS)
+        fig_dist = px.bar(
+            histogram,
             x='Vendas (litros)',
-            nbins=20,
+            y='count',
             title='Distribuição das Vendas',
+            hover_data={'Início': ':,.0f', 'Fim': ':,.0f'},
             template='plotly_white'
         )
+        fig_dist.update_traces(width=histogram['Fim'] - histogram['Início'])
+        fig_dist.update_layout(bargap=0)
         visualizations['distribution'] = fig_dist
         
     return visualizations
 
 # Função para analisar correlações
-def analyze_correlations(df):
-    correlations = {}
-    
-    if 'Vendas (litros)' in df.columns:
-        # Correlação entre marca e vendas
-        brand_corr = df.groupby('Marca')['Vendas (litros)'].mean().reset_index()
-        brand_corr = brand_corr.sort_values('Vendas (litros)', ascending=False)
-        
-        # Correlação entre estação e vendas
-        season_corr = df.groupby('Estação')['Vendas (litros)'].mean().reset_index()
-        season_order = {"Estação": ["Verão", "Outono", "Inverno", "Primavera"]}
-        season_corr = season_corr.set_index('Estação').reindex(season_order["Estação"]).reset_index()
-        
-        # Correlação entre localidade e vendas
-        location_corr = df.groupby(['Cidade', 'Bairro'])['Vendas (litros)'].mean().reset_index()
-        location_corr = location_corr.sort_values('Vendas (litros)', ascending=False)
-        
-        # Correlação entre marca e estação
-        brand_season_corr = df.pivot_table(
-            index='Marca',
-            columns='Estação',
-            values='Vendas (litros)',
-            aggfunc='mean'
-        ).reset_index()
-        
-        correlations['brand'] = brand_corr
-        correlations['season'] = season_corr
-        correlations['location'] = location_corr
-        correlations['brand_season'] = brand_season_corr
-        
-        # Simulação de dados climáticos
-        # Criando uma relação simulada entre estação e temperatura média
-        temp_map = {
-            'Verão': np.random.normal(30, 2, size=len(df[df['Estação'] == 'Verão'])),
-            'Outono': np.random.normal(22, 2, size=len(df[df['Estação'] == 'Outono'])),
-            'Inverno': np.random.normal(15, 2, size=len(df[df['Estação'] == 'Inverno'])),
-            'Primavera': np.random.normal(25, 2, size=len(df[df['Estação'] == 'Primavera']))
-        }
-        
-        df_climate = df.copy()
-        df_climate['Temperatura'] = df_climate['Estação'].map(lambda x: np.random.choice(temp_map[x]))
-        
-        # Correlação entre temperatura e vendas
-        climate_corr = df_climate.groupby('Temperatura').agg({'Vendas (litros)': 'mean'}).reset_index()
-        climate_corr = climate_corr.sort_values('Temperatura')
-        
-        correlations['climate'] = climate_corr
-        correlations['df_climate'] = df_climate
-    
+@get_profiler().profile("analyze_correlations", rows=input_rows)
+def analyze_correlations(df, bin_width=CLIMATE_BIN_WIDTH, seed=CLIMATE_SEED):
+    if 'Vendas (litros)' not in df.columns:
+        return {}
+    cache = get_correlation_cache()
+    key = (dataset_fingerprint(df), bin_width, seed)
+    correlations = cache.get(key)
+    if correlations is None:
+        correlations = correlation_tables(df, get_aggregation_cube(df), bin_width, seed)
+        cache.put(key, correlations)
     return correlations
 
+# Acrescenta as retas de tendência já ajustadas (uma por linha de trends, identificada pela
+# coluna label_column) com a banda de confiança, na cor da série correspondente do gráfico.
+# As retas vêm das estatísticas suficientes, sem reajustar sobre os pontos
+def add_trendlines(fig, trends, label_column, x, y):
+    colors = {trace.name: trace.marker.color for trace in fig.data}
+    default_color = fig.data[0].marker.color if fig.data else None
+    for _, row in trends.iterrows():
+        fit = RegressionStats.from_row(row)
+        slope, intercept = fit.coefficients()
+        if np.isnan(slope):
+            continue
+        label = str(row[label_column])
+        color = colors.get(label, default_color)
+        line_x = np.linspace(fit.x_min, fit.x_max, REGRESSION_BAND_POINTS)
+        lower, upper = fit.band(line_x)
+        fig.add_trace(go.Scatter(
+            x=np.concatenate([line_x, line_x[::-1]]),
+            y=np.concatenate([upper, lower[::-1]]),
+            fill='toself',
+            fillcolor=color,
+            opacity=0.2,
+            line=dict(width=0),
+            hoverinfo='skip',
+            showlegend=False
+        ))
+        fig.add_trace(go.Scatter(
+            x=line_x[[0, -1]],
+            y=fit.predict(line_x[[0, -1]]),
+            mode='lines',
+            name=label,
+            line=dict(color=color),
+            showlegend=False,
+            hovertemplate=(
+                f"{label_column}={label}<br>{y} = {slope:,.2f} * {x} + {intercept:,.2f}"
+                f"<br>R² = {fit.r_squared():.3f}<extra></extra>"
+            )
+        ))
+
 # Função para gerar visualizações de correlação
 def create_correlation_visualizations(correlations):
     corr_viz = {}
@@ -338,9 +911,10 @@ def create_correlation_visualizations(correlations):
                 x='Temperatura',
                 y='Vendas (litros)',
                 title='Relação entre Temperatura e Vendas',
-                trendline='ols',
                 template='plotly_white'
             )
+            if 'climate_trend' in correlations:
+                add_trendlines(fig_climate, correlations['climate_trend'], 'Série', 'Temperatura', 'Vendas (litros)')
             corr_viz['climate'] = fig_climate
         
         # Mapa de calor da correlação entre marca e estação
@@ -383,50 +957,153 @@ def create_correlation_visualizations(correlations):
             
         # Visualização da correlação entre marca e vendas por estação
         if 'df_climate' in correlations:
+            df_climate = correlations['df_climate']
+            # Acima do orçamento, os pontos são reduzidos com LTTB; as retas de tendência
+            # foram ajustadas sobre todas as linhas, não sobre os pontos exibidos
+            if len(df_climate) > SCATTER_POINT_BUDGET:
+                df_climate = downsample_scatter(df_climate, 'Temperatura', 'Vendas (litros)', color='Marca')
             fig_brand_temp = px.scatter(
-                correlations['df_climate'],
+                df_climate,
                 x='Temperatura',
                 y='Vendas (litros)',
                 color='Marca',
                 title='Vendas por Temperatura e Marca',
-                trendline='ols',
                 template='plotly_white'
             )
+            if 'brand_trends' in correlations:
+                add_trendlines(fig_brand_temp, correlations['brand_trends'], 'Marca', 'Temperatura', 'Vendas (litros)')
             corr_viz['brand_temp'] = fig_brand_temp
+        
+        # Força de associação de cada dimensão com as vendas (eta² e Kruskal-Wallis)
+        if 'sales_association' in correlations:
+            fig_sales_association = px.bar(
+                correlations['sales_association'],
+                x='Dimensão',
+                y='Eta²',
+                hover_data=['Categorias', 'H (Kruskal-Wallis)', 'p-valor'],
+                title='Quanto da Variação das Vendas Cada Dimensão Explica (Eta²)',
+                range_y=[0, 1],
+                template='plotly_white'
+            )
+            corr_viz['sales_association'] = fig_sales_association
+        
+        # Matriz de associação entre as dimensões (V de Cramér)
+        if 'cramers_v' in correlations:
+            cramers_v = correlations['cramers_v'].set_index('Dimensão')
+            fig_association = px.imshow(
+                cramers_v,
+                title='Associação entre Dimensões (V de Cramér)',
+                labels=dict(x="Dimensão", y="Dimensão", color="V de Cramér"),
+                zmin=0,
+                zmax=1,
+                text_auto='.2f',
+                color_continuous_scale='Blues',
+                template='plotly_white'
+            )
+            corr_viz['association'] = fig_association
     
     return corr_viz
 
-# Função para gerar um resumo dos dados para o ChatGPT
-def generate_data_summary(df, stats, brand_stats, season_stats, location_stats):
-    summary = f"""
-    Resumo dos dados de vendas de cerveja:
-    
-    Estatísticas gerais:
-    - Total de registros: {len(df)}
-    - Média de vendas: {stats['mean']:.2f} litros
-    - Mediana de vendas: {stats['50%']:.2f} litros
-    - Desvio padrão: {stats['std']:.2f} litros
-    - Mínimo: {stats['min']:.2f} litros
-    - Máximo: {stats['max']:.2f} litros
-    
-    Marcas presentes: {', '.join(df['Marca'].unique())}
-    Cidades presentes: {', '.join(df['Cidade'].unique())}
-    Bairros presentes: {', '.join(df['Bairro'].unique())}
-    Estações do ano: {', '.join(df['Estação'].unique())}
-    
-    Top 3 marcas por vendas totais:
-    {brand_stats.sort_values('Total', ascending=False).head(3)[['Marca', 'Total']].to_string(index=False)}
-    
-    Vendas por estação (total):
-    {season_stats[['Estação', 'Total']].to_string(index=False)}
-    
-    Top 3 localidades por vendas totais:
-    {location_stats.sort_values('Total', ascending=False).head(3)[['Cidade', 'Bairro', 'Total']].to_string(index=False)}
-    """
-    
+# Configurações do cache de resumos enviados ao ChatGPT
+SUMMARY_CACHE_MAX_ENTRIES = 32
+
+@st.cache_resource
+def get_summary_cache():
+    return BoundedLRU(SUMMARY_CACHE_MAX_ENTRIES)
+
+# Função para gerar um resumo dos dados para o ChatGPT, dentro do orçamento de tokens.
+# Para versões lidas em blocos, o total de registros é o do arquivo inteiro, não o da amostra
+def generate_data_summary(df, stats, brand_stats, season_stats, location_stats,
+                          token_budget=SUMMARY_TOKEN_BUDGET, top_k=SUMMARY_TOP_K):
+    version = dataset_fingerprint(df)
+    stream_summary = get_dataset_registry().stream_summary(version)
+    n_rows = stream_summary.rows if stream_summary is not None else len(df)
+    cache = get_summary_cache()
+    key = (version, n_rows, token_budget, top_k)
+    summary = cache.get(key)
+    if summary is None:
+        summary = build_data_summary(n_rows, stats, brand_stats, season_stats, location_stats, token_budget, top_k)
+        cache.put(key, summary)
     return summary
 
+# Configurações das tarefas em segundo plano: backend de cada etapa e intervalo de
+# atualização do progresso na página. O pré-processamento também pode rodar em processos
+# ("process"), ao custo de copiar o dataset para o processo e o resultado de volta
+STEP_JOB_BACKENDS = {
+    'preprocess_data': "thread",
+    'analyze_correlations': "thread",
+    'ask_questions': "thread"
+}
+JOB_POLL_SECONDS = 0.5
+
+# Executor único compartilhado por todas as sessões: a mesma tarefa (versão do dataset e
+# etapa) pedida por várias sessões ou por cliques repetidos é executada uma única vez
+@st.cache_resource
+def get_job_executor():
+    return JobExecutor()
+
+# Libera a tarefa em nome da sessão; ela é cancelada se nenhuma outra sessão a espera
+def finish_job(key):
+    get_job_executor().release(key, st.session_state.job_owner)
+    st.session_state.jobs.pop(key, None)
+
+def cancel_job(key):
+    finish_job(key)
+    st.session_state.cancelled_jobs.add(key)
+
+# Libera as tarefas de etapas que o usuário deixou
+def release_stale_jobs(step):
+    for key, job_step in list(st.session_state.jobs.items()):
+        if job_step != step:
+            finish_job(key)
+
+# Andamento da tarefa, atualizado a cada JOB_POLL_SECONDS sem reexecutar a página, com os
+# resultados parciais exibidos por show_partial(job); quando a tarefa termina, a página é
+# reexecutada para exibir o resultado
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def show_job_progress(job, label, show_partial=None):
+    if job.done():
+        st.rerun()
+    st.progress(job.progress, text=f"⏳ {label}: {job.message or 'aguardando'} ({job.elapsed():.0f} s)")
+    if show_partial is not None:
+        show_partial(job)
+    if st.button("Cancelar", key=f"cancel_{job.key[1]}"):
+        cancel_job(job.key)
+        st.rerun()
+
+# Executa fn(*args, **kwargs) em segundo plano com a chave key = (versão, etapa, parâmetros)
+# e devolve a tarefa concluída; enquanto ela roda, exibe o andamento (e os resultados
+# parciais, com show_partial) e devolve None. Uma
+# tarefa anterior da mesma etapa com outros parâmetros é liberada, e uma tarefa cancelada
+# pelo usuário só volta a rodar quando ele pede
+def background_job(key, label, fn, *args, rows=None, show_partial=None, **kwargs):
+    step_name = key[1]
+    for other in list(st.session_state.jobs):
+        if other[1] == step_name and other != key:
+            finish_job(other)
+    if key in st.session_state.cancelled_jobs:
+        st.info(f"⏹️ {label} cancelado.")
+        if st.button("Executar novamente", key=f"retry_{step_name}"):
+            st.session_state.cancelled_jobs.discard(key)
+            st.rerun()
+        return None
+    backend = STEP_JOB_BACKENDS.get(step_name, "thread")
+    if backend == "thread":
+        fn = get_profiler().profile(step_name, rows=rows)(fn)
+    job = get_job_executor().submit(
+        key, fn, *args, backend=backend, owner=st.session_state.job_owner, progress=backend == "thread", **kwargs
+    )
+    st.session_state.jobs[key] = st.session_state.current_step
+    if job.status == "failed":
+        finish_job(key)
+        raise job.error
+    if job.status != "done":
+        show_job_progress(job, label, show_partial)
+        return None
+    return job
+
 # Etapa 1: Ingestão de Dados
+@get_profiler().profile("step_1_data_ingestion")
 def step_1_data_ingestion():
     st.markdown("<h2 class='sub-header'>Etapa 1: Ingestão de Dados</h2>", unsafe_allow_html=True)
     
@@ -445,25 +1122,53 @@ def step_1_data_ingestion():
         
         # Opção para usar o arquivo de exemplo ou fazer upload
         use_example = st.checkbox("Usar arquivo de exemplo", value=True)
+        streaming = st.checkbox(
+            "Leitura em blocos (arquivos maiores que a memória)",
+            value=False,
+            help="Lê o CSV em blocos e mantém apenas agregados e uma amostra em memória."
+        )
         
+        source = None
         if use_example:
             file_path = "vendas_cerveja_expandida.csv"
             if os.path.exists(file_path):
-                df = pd.read_csv(file_path)
-                st.session_state.data = df
-                st.success(f"✅ Arquivo de exemplo carregado com sucesso: {len(df)} registros")
+                source = file_path
             else:
                 st.error("❌ Arquivo de exemplo não encontrado")
         else:
-            uploaded_file = st.file_uploader("Escolha um arquivo CSV", type="csv")
-            if uploaded_file is not None:
-                df = load_data(uploaded_file)
+            source = st.file_uploader("Escolha um arquivo CSV", type="csv")
+        
+        if source is not None:
+            label = "Arquivo de exemplo carregado" if use_example else "Arquivo carregado"
+            if streaming:
+                summary = load_data_streaming(source)
+                if summary is not None:
+                    select_source_dataset(summary.sample, summary)
+                    st.success(f"✅ {label} em blocos: {summary.rows} registros ({len(summary.sample)} em amostra)")
+            else:
+                df = load_data(source)
                 if df is not None:
-                    st.session_state.data = df
-                    st.success(f"✅ Arquivo carregado com sucesso: {len(df)} registros")
+                    select_source_dataset(df)
+                    st.success(f"✅ {label} com sucesso: {len(df)} registros")
+        
+        show_ingestion_cache_stats()
+        show_dataset_store_stats()
     
     with col2:
-        if st.session_state.data is not None:
+        summary = st.session_state.stream_summary
+        if st.session_state.data is not None and summary is not None:
+            st.markdown("### Visualização dos Dados Brutos")
+            st.dataframe(summary.preview, use_container_width=True)
+            
+            st.markdown("### Informações do Dataset")
+            st.write(f"**Número de registros:** {summary.rows}")
+            st.write(f"**Registros na amostra:** {len(summary.sample)}")
+            st.write(f"**Colunas:** {', '.join(summary.preview.columns)}")
+            if 'Vendas (litros)' in summary.preview.columns and summary.rows > 0:
+                bounds = summary.outlier_bounds().iloc[0]
+                st.write(f"**Limites de outliers (IQR):** {bounds['Limite Inferior']:,.0f} a {bounds['Limite Superior']:,.0f} litros")
+                st.write(f"**Outliers estimados:** {summary.estimated_outliers()}")
+        elif st.session_state.data is not None:
             st.markdown("### Visualização dos Dados Brutos")
             st.dataframe(st.session_state.data.head(10), use_container_width=True)
             
@@ -472,13 +1177,22 @@ def step_1_data_ingestion():
             st.write(f"**Colunas:** {', '.join(st.session_state.data.columns)}")
     
     if st.session_state.data is not None:
+        # Na leitura em blocos, linhas e valores únicos das dimensões vêm do arquivo inteiro
+        # (células do cubo); as demais colunas só podem ser contadas na amostra
+        summary = st.session_state.stream_summary
+        cube_cells = summary.to_cube().cells if summary is not None and summary.rows > 0 else None
+        n_rows = summary.rows if summary is not None else st.session_state.data.shape[0]
         st.markdown("### Estrutura do Dataset")
         buffer = []
-        buffer.append(f"**Dimensões:** {st.session_state.data.shape[0]} linhas x {st.session_state.data.shape[1]} colunas")
+        buffer.append(f"**Dimensões:** {n_rows} linhas x {st.session_state.data.shape[1]} colunas")
         
         for col in st.session_state.data.columns:
-            unique_values = st.session_state.data[col].nunique()
-            buffer.append(f"**{col}:** {unique_values} valores únicos")
+            if cube_cells is None:
+                buffer.append(f"**{col}:** {st.session_state.data[col].nunique()} valores únicos")
+            elif col in cube_cells.columns:
+                buffer.append(f"**{col}:** {cube_cells[col].nunique()} valores únicos")
+            else:
+                buffer.append(f"**{col}:** {st.session_state.data[col].nunique()} valores únicos na amostra")
         
         col1, col2 = st.columns(2)
         for i, item in enumerate(buffer):
@@ -492,6 +1206,7 @@ def step_1_data_ingestion():
             st.experimental_rerun()
 
 # Etapa 2: Limpeza e Pré-processamento
+@get_profiler().profile("step_2_preprocessing")
 def step_2_preprocessing():
     st.markdown("<h2 class='sub-header'>Etapa 2: Limpeza e Pré-processamento</h2>", unsafe_allow_html=True)
     
@@ -505,8 +1220,54 @@ def step_2_preprocessing():
     """, unsafe_allow_html=True)
     
     if st.session_state.data is not None:
-        # Processar os dados
-        df_clean, missing_values, dtypes, outliers = preprocess_data(st.session_state.data)
+        outlier_group = OUTLIER_GROUP_OPTIONS[st.radio(
+            "Detecção de outliers",
+            options=list(OUTLIER_GROUP_OPTIONS),
+            horizontal=True,
+            help="Limites IQR calculados sobre todas as vendas ou separadamente para cada grupo."
+        )]
+        
+        # Processar os dados a partir da versão de origem; o resultado de cada combinação
+        # (origem, parâmetros) é reaproveitado ao voltar para esta etapa. Para versões lidas
+        # em blocos, valores ausentes e outliers vêm do resumo do arquivo inteiro, e a amostra
+        # só fornece exemplos das linhas fora dos limites
+        registry = get_dataset_registry()
+        source_version = registry.root(current_dataset_version())
+        stream_summary = registry.stream_summary(source_version)
+        derivation = registry.derivation(source_version, 'preprocess', outlier_group)
+        if derivation is None:
+            key = (source_version, 'preprocess_data', outlier_group)
+            job = background_job(key, "Pré-processamento", preprocess_data, registry.get(source_version), outlier_group, rows=input_rows)
+            if job is None:
+                return
+            df_clean, missing_values, dtypes, outliers, memory, outlier_bounds = job.result
+            finish_job(key)
+            outlier_count = len(outliers)
+            if stream_summary is not None:
+                missing_values = stream_summary.missing
+                if len(outlier_bounds) > 0:
+                    detector = stream_summary.outlier_detectors[outlier_group]
+                    outlier_bounds = detector.bounds()
+                    outlier_count = detector.estimated_outliers()
+                    outliers = df_clean[detector.flag(df_clean)]
+            clean_version = registry.add(dataset_fingerprint(df_clean), df_clean, 'clean', source_version)
+            derivation = (clean_version, {
+                'missing_values': missing_values,
+                'dtypes': dtypes,
+                'outliers': outliers,
+                'outlier_count': outlier_count,
+                'memory': memory,
+                'outlier_bounds': outlier_bounds
+            })
+            registry.add_derivation(source_version, 'preprocess', outlier_group, *derivation)
+        clean_version, artifacts = derivation
+        df_clean = registry.get(clean_version)
+        missing_values = artifacts['missing_values']
+        dtypes = artifacts['dtypes']
+        outliers = artifacts['outliers']
+        outlier_count = artifacts['outlier_count']
+        memory = artifacts['memory']
+        outlier_bounds = artifacts['outlier_bounds']
         
         col1, col2 = st.columns([1, 1])
         
@@ -519,25 +1280,45 @@ def step_2_preprocessing():
                 st.write(missing_values)
             
             st.markdown("<h3 class='step-header'>Tipos de Dados</h3>", unsafe_allow_html=True)
-            st.write(dtypes)
+            st.write(dtypes.astype(str))
+            
+            st.markdown("<h3 class='step-header'>Otimização de Memória</h3>", unsafe_allow_html=True)
+            memory_before = memory['Antes (KB)'].sum()
+            memory_after = memory['Depois (KB)'].sum()
+            st.metric(
+                "Memória do dataset",
+                f"{memory_after:,.1f} KB",
+                f"-{memory_before - memory_after:,.1f} KB ({memory_before / max(memory_after, 1e-9):.1f}x menor)",
+                delta_color="inverse"
+            )
+            st.dataframe(memory, use_container_width=True, hide_index=True)
         
         with col2:
             st.markdown("<h3 class='step-header'>Verificação de Outliers</h3>", unsafe_allow_html=True)
-            if len(outliers) == 0:
+            if outlier_count == 0:
                 st.success("✅ Não foram detectados outliers significativos nas vendas.")
+            elif stream_summary is not None:
+                st.warning(f"⚠️ Foram estimados {outlier_count} possíveis outliers nas vendas do arquivo inteiro.")
+                st.caption(f"Exemplos na amostra ({len(outliers)} de {len(df_clean)} registros da amostra):")
+                st.dataframe(outliers.head())
             else:
-                st.warning(f"⚠️ Foram detectados {len(outliers)} possíveis outliers nas vendas.")
+                st.warning(f"⚠️ Foram detectados {outlier_count} possíveis outliers nas vendas.")
                 st.dataframe(outliers.head())
+            if len(outlier_bounds) > 0:
+                st.dataframe(outlier_bounds, use_container_width=True, hide_index=True)
             
             st.markdown("<h3 class='step-header'>Estatísticas Básicas</h3>", unsafe_allow_html=True)
-            if 'Vendas (litros)' in df_clean.columns:
+            if stream_summary is not None and stream_summary.rows > 0:
+                st.write(stream_summary.to_cube().describe())
+            elif 'Vendas (litros)' in df_clean.columns:
                 st.write(df_clean['Vendas (litros)'].describe())
         
         st.markdown("<h3 class='step-header'>Dados Após Pré-processamento</h3>", unsafe_allow_html=True)
         st.dataframe(df_clean.head(10), use_container_width=True)
         
-        # Atualizar os dados na sessão
-        st.session_state.data = df_clean
+        # Atualizar os dados na sessão apenas quando a versão limpa mudou
+        if registry.set_current(clean_version) or st.session_state.data is not df_clean:
+            st.session_state.data = df_clean
         
         st.markdown("""
         <div class='success-box'>
@@ -557,6 +1338,7 @@ def step_2_preprocessing():
             st.experimental_rerun()
 
 # Etapa 3: Análise Exploratória
+@get_profiler().profile("step_3_exploratory_analysis")
 def step_3_exploratory_analysis():
     st.markdown("<h2 class='sub-header'>Etapa 3: Análise Exploratória de Dados</h2>", unsafe_allow_html=True)
     
@@ -611,7 +1393,7 @@ def step_3_exploratory_analysis():
                 y='Total',
                 title='Vendas Totais por Estação',
                 color='Estação',
-                category_orders={"Estação": ["Verão", "Outono", "Inverno", "Primavera"]},
+                category_orders={"Estação": SEASON_ORDER},
                 template='plotly_white'
             )
             st.plotly_chart(fig_season, use_container_width=True)
@@ -649,7 +1431,93 @@ def step_3_exploratory_analysis():
             st.session_state.current_step = 1
             st.experimental_rerun()
 
+# Filtros e gráficos da etapa 4 em um fragmento: uma mudança nos filtros reexecuta
+# apenas este painel (agregados e figuras da seleção), sem reexecutar o script inteiro
+@st.fragment
+@get_profiler().profile("visualization_panel")
+def visualization_panel(df):
+    filter_index = get_filter_index(df)
+    
+    # Filtros interativos
+    st.markdown("<h3 class='step-header'>Filtros</h3>", unsafe_allow_html=True)
+    
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        selected_cities = st.multiselect(
+            "Selecione as Cidades",
+            options=filter_index.options('Cidade'),
+            default=filter_index.options('Cidade')
+        )
+    
+    with col2:
+        selected_neighborhoods = st.multiselect(
+            "Selecione os Bairros",
+            options=filter_index.options('Bairro'),
+            default=filter_index.options('Bairro')
+        )
+    
+    with col3:
+        selected_seasons = st.multiselect(
+            "Selecione as Estações",
+            options=filter_index.options('Estação'),
+            default=filter_index.options('Estação')
+        )
+    
+    # Filtrar os dados: interseção de bitmaps para as linhas e subcubo para os agregados,
+    # sem copiar as linhas do dataset
+    selections = {
+        'Cidade': selected_cities,
+        'Bairro': selected_neighborhoods,
+        'Estação': selected_seasons
+    }
+    positions = filter_index.select(selections)
+    filtered_cube = get_aggregation_cube(df).filter(selections)
+    filtered_rows = filter_index.n if positions is None else len(positions)
+    
+    if filtered_rows > 0:
+        # Gerar visualizações (ou reaproveitar as da mesma seleção)
+        def build_visualizations():
+            sales = df['Vendas (litros)'].to_numpy()
+            filtered_sales = pd.DataFrame({'Vendas (litros)': sales if positions is None else sales[positions]})
+            return create_visualizations(filtered_sales, filtered_cube)
+        
+        visualizations = get_cached_figures(
+            figure_cache_key(df, 'visualizations', selections),
+            build_visualizations
+        )
+        
+        st.markdown("<h3 class='step-header'>Vendas por Marca</h3>", unsafe_allow_html=True)
+        st.plotly_chart(visualizations['brands'], use_container_width=True)
+        
+        st.markdown("<h3 class='step-header'>Vendas por Estação</h3>", unsafe_allow_html=True)
+        st.plotly_chart(visualizations['seasons'], use_container_width=True)
+        
+        st.markdown("<h3 class='step-header'>Vendas por Localidade</h3>", unsafe_allow_html=True)
+        st.plotly_chart(visualizations['locations'], use_container_width=True)
+        
+        st.markdown("<h3 class='step-header'>Vendas por Marca e Estação</h3>", unsafe_allow_html=True)
+        st.plotly_chart(visualizations['brand_season'], use_container_width=True)
+        
+        st.markdown("<h3 class='step-header'>Distribuição das Vendas</h3>", unsafe_allow_html=True)
+        st.plotly_chart(visualizations['distribution'], use_container_width=True)
+        
+        st.markdown("""
+        <div class='success-box'>
+        <b>Insights das Visualizações:</b><br>
+        As visualizações interativas permitem explorar os dados de diferentes perspectivas, revelando padrões de vendas por marca, 
+        estação do ano e localidade. Você pode usar os filtros acima para focar em segmentos específicos e descobrir insights mais detalhados.
+        </div>
+        """, unsafe_allow_html=True)
+        
+        if st.button("Avançar para Análise de Correlações ▶️"):
+            st.session_state.current_step = 5
+            st.rerun()
+    else:
+        st.warning("⚠️ Nenhum dado encontrado com os filtros selecionados.")
+
 # Etapa 4: Visualizações Interativas
+@get_profiler().profile("step_4_interactive_visualizations")
 def step_4_interactive_visualizations():
     st.markdown("<h2 class='sub-header'>Etapa 4: Visualizações Interativas</h2>", unsafe_allow_html=True)
     
@@ -662,80 +1530,101 @@ def step_4_interactive_visualizations():
     """, unsafe_allow_html=True)
     
     if st.session_state.data is not None:
-        df = st.session_state.data
+        visualization_panel(st.session_state.data)
+    else:
+        st.warning("⚠️ Por favor, carregue os dados na primeira etapa.")
+        if st.button("Voltar para Ingestão de Dados ◀️"):
+            st.session_state.current_step = 1
+            st.experimental_rerun()
+
+# Gráficos da etapa 5 em um fragmento: mudar a largura das faixas de temperatura
+# reexecuta apenas este painel
+@st.fragment
+@get_profiler().profile("correlation_panel")
+def correlation_panel(df):
+    bin_width = st.slider(
+        "Largura da faixa de temperatura (°C)",
+        min_value=0.5,
+        max_value=5.0,
+        value=CLIMATE_BIN_WIDTH,
+        step=0.5
+    )
+    
+    # Analisar correlações em segundo plano e criar as visualizações, reaproveitadas
+    # enquanto o dataset e a largura das faixas não mudarem
+    figures_key = figure_cache_key(df, 'correlations', bin_width=bin_width)
+    correlations_key = (dataset_fingerprint(df), bin_width, CLIMATE_SEED)
+    if ('Vendas (litros)' in df.columns and figures_key not in get_figure_cache()
+            and get_correlation_cache().get(correlations_key) is None):
+        key = (dataset_fingerprint(df), 'analyze_correlations', bin_width, CLIMATE_SEED)
+        job = background_job(key, "Análise de correlações", correlation_tables, df, get_aggregation_cube(df), bin_width, CLIMATE_SEED, rows=input_rows)
+        if job is None:
+            return
+        get_correlation_cache().put(correlations_key, job.result)
+        finish_job(key)
+    corr_viz = get_cached_figures(
+        figures_key,
+        lambda: create_correlation_visualizations(analyze_correlations(df, bin_width))
+    )
+    
+    if corr_viz:
         
-        # Filtros interativos
-        st.markdown("<h3 class='step-header'>Filtros</h3>", unsafe_allow_html=True)
+        st.markdown("<h3 class='step-header'>Relação entre Temperatura e Vendas</h3>", unsafe_allow_html=True)
+        st.markdown("""
+        <div class='info-box'>
+        <b>Nota:</b> Os dados de temperatura são simulados para demonstrar a análise de correlação com fatores climáticos.
+        </div>
+        """, unsafe_allow_html=True)
+        st.plotly_chart(corr_viz['climate'], use_container_width=True)
         
-        col1, col2, col3 = st.columns(3)
+        st.markdown("<h3 class='step-header'>Mapa de Calor: Vendas por Marca e Estação</h3>", unsafe_allow_html=True)
+        st.plotly_chart(corr_viz['heatmap'], use_container_width=True)
         
-        with col1:
-            selected_cities = st.multiselect(
-                "Selecione as Cidades",
-                options=df['Cidade'].unique(),
-                default=df['Cidade'].unique()
-            )
+        st.markdown("<h3 class='step-header'>Top 10 Localidades por Média de Vendas</h3>", unsafe_allow_html=True)
+        st.plotly_chart(corr_viz['location'], use_container_width=True)
         
-        with col2:
-            selected_neighborhoods = st.multiselect(
-                "Selecione os Bairros",
-                options=df['Bairro'].unique(),
-                default=df['Bairro'].unique()
-            )
+        st.markdown("<h3 class='step-header'>Média de Vendas por Estação</h3>", unsafe_allow_html=True)
+        st.plotly_chart(corr_viz['season'], use_container_width=True)
         
-        with col3:
-            selected_seasons = st.multiselect(
-                "Selecione as Estações",
-                options=df['Estação'].unique(),
-                default=df['Estação'].unique()
-            )
+        st.markdown("<h3 class='step-header'>Vendas por Temperatura e Marca</h3>", unsafe_allow_html=True)
+        st.plotly_chart(corr_viz['brand_temp'], use_container_width=True)
         
-        # Filtrar os dados
-        filtered_df = df[
-            (df['Cidade'].isin(selected_cities)) &
-            (df['Bairro'].isin(selected_neighborhoods)) &
-            (df['Estação'].isin(selected_seasons))
-        ]
+        if 'sales_association' in corr_viz:
+            st.markdown("<h3 class='step-header'>Força de Associação com as Vendas</h3>", unsafe_allow_html=True)
+            st.markdown("""
+            <div class='info-box'>
+            <b>Como ler:</b> o eta² indica a fração da variação das vendas explicada pela dimensão (de 0 a 1). 
+            O teste de Kruskal-Wallis (H e p-valor, no detalhe de cada barra) verifica se as vendas diferem entre as categorias sem supor distribuição normal.
+            </div>
+            """, unsafe_allow_html=True)
+            st.plotly_chart(corr_viz['sales_association'], use_container_width=True)
         
-        if len(filtered_df) > 0:
-            # Gerar visualizações
-            visualizations = create_visualizations(filtered_df)
-            
-            st.markdown("<h3 class='step-header'>Vendas por Marca</h3>", unsafe_allow_html=True)
-            st.plotly_chart(visualizations['brands'], use_container_width=True)
-            
-            st.markdown("<h3 class='step-header'>Vendas por Estação</h3>", unsafe_allow_html=True)
-            st.plotly_chart(visualizations['seasons'], use_container_width=True)
-            
-            st.markdown("<h3 class='step-header'>Vendas por Localidade</h3>", unsafe_allow_html=True)
-            st.plotly_chart(visualizations['locations'], use_container_width=True)
-            
-            st.markdown("<h3 class='step-header'>Vendas por Marca e Estação</h3>", unsafe_allow_html=True)
-            st.plotly_chart(visualizations['brand_season'], use_container_width=True)
-            
-            st.markdown("<h3 class='step-header'>Distribuição das Vendas</h3>", unsafe_allow_html=True)
-            st.plotly_chart(visualizations['distribution'], use_container_width=True)
-            
+        if 'association' in corr_viz:
+            st.markdown("<h3 class='step-header'>Associação entre Dimensões</h3>", unsafe_allow_html=True)
             st.markdown("""
-            <div class='success-box'>
-            <b>Insights das Visualizações:</b><br>
-            As visualizações interativas permitem explorar os dados de diferentes perspectivas, revelando padrões de vendas por marca, 
-            estação do ano e localidade. Você pode usar os filtros acima para focar em segmentos específicos e descobrir insights mais detalhados.
+            <div class='info-box'>
+            <b>Como ler:</b> o V de Cramér mede a dependência entre duas dimensões, de 0 (independentes) a 1 (uma determina a outra), 
+            como os bairros, que pertencem a uma única cidade.
             </div>
             """, unsafe_allow_html=True)
-            
-            if st.button("Avançar para Análise de Correlações ▶️"):
-                st.session_state.current_step = 5
-                st.experimental_rerun()
-        else:
-            st.warning("⚠️ Nenhum dado encontrado com os filtros selecionados.")
+            st.plotly_chart(corr_viz['association'], use_container_width=True)
+        
+        st.markdown("""
+        <div class='success-box'>
+        <b>Insights da Análise de Correlação:</b><br>
+        A análise de correlação revela relações importantes entre as vendas de cerveja e fatores como temperatura, estação do ano e localidade. 
+        Estas correlações fornecem insights valiosos para estratégias de marketing, gestão de estoque e segmentação de mercado.
+        </div>
+        """, unsafe_allow_html=True)
+        
+        if st.button("Avançar para Insights com IA ▶️"):
+            st.session_state.current_step = 6
+            st.rerun()
     else:
-        st.warning("⚠️ Por favor, carregue os dados na primeira etapa.")
-        if st.button("Voltar para Ingestão de Dados ◀️"):
-            st.session_state.current_step = 1
-            st.experimental_rerun()
+        st.error("❌ Não foi possível analisar correlações. Verifique se os dados contêm as colunas necessárias.")
 
 # Etapa 5: Análise de Correlações
+@get_profiler().profile("step_5_correlation_analysis")
 def step_5_correlation_analysis():
     st.markdown("<h2 class='sub-header'>Etapa 5: Análise de Correlações</h2>", unsafe_allow_html=True)
     
@@ -749,46 +1638,7 @@ def step_5_correlation_analysis():
     """, unsafe_allow_html=True)
     
     if st.session_state.data is not None:
-        # Analisar correlações
-        correlations = analyze_correlations(st.session_state.data)
-        
-        if correlations:
-            # Criar visualizações de correlação
-            corr_viz = create_correlation_visualizations(correlations)
-            
-            st.markdown("<h3 class='step-header'>Relação entre Temperatura e Vendas</h3>", unsafe_allow_html=True)
-            st.markdown("""
-            <div class='info-box'>
-            <b>Nota:</b> Os dados de temperatura são simulados para demonstrar a análise de correlação com fatores climáticos.
-            </div>
-            """, unsafe_allow_html=True)
-            st.plotly_chart(corr_viz['climate'], use_container_width=True)
-            
-            st.markdown("<h3 class='step-header'>Mapa de Calor: Vendas por Marca e Estação</h3>", unsafe_allow_html=True)
-            st.plotly_chart(corr_viz['heatmap'], use_container_width=True)
-            
-            st.markdown("<h3 class='step-header'>Top 10 Localidades por Média de Vendas</h3>", unsafe_allow_html=True)
-            st.plotly_chart(corr_viz['location'], use_container_width=True)
-            
-            st.markdown("<h3 class='step-header'>Média de Vendas por Estação</h3>", unsafe_allow_html=True)
-            st.plotly_chart(corr_viz['season'], use_container_width=True)
-            
-            st.markdown("<h3 class='step-header'>Vendas por Temperatura e Marca</h3>", unsafe_allow_html=True)
-            st.plotly_chart(corr_viz['brand_temp'], use_container_width=True)
-            
-            st.markdown("""
-            <div class='success-box'>
-            <b>Insights da Análise de Correlação:</b><br>
-            A análise de correlação revela relações importantes entre as vendas de cerveja e fatores como temperatura, estação do ano e localidade. 
-            Estas correlações fornecem insights valiosos para estratégias de marketing, gestão de estoque e segmentação de mercado.
-            </div>
-            """, unsafe_allow_html=True)
-            
-            if st.button("Avançar para Insights com IA ▶️"):
-                st.session_state.current_step = 6
-                st.experimental_rerun()
-        else:
-            st.error("❌ Não foi possível analisar correlações. Verifique se os dados contêm as colunas necessárias.")
+        correlation_panel(st.session_state.data)
     else:
         st.warning("⚠️ Por favor, carregue os dados na primeira etapa.")
         if st.button("Voltar para Ingestão de Dados ◀️"):
@@ -796,6 +1646,7 @@ def step_5_correlation_analysis():
             st.experimental_rerun()
 
 # Etapa 6: Insights com IA
+@get_profiler().profile("step_6_ai_insights")
 def step_6_ai_insights():
     st.markdown("<h2 class='sub-header'>Etapa 6: Insights com IA</h2>", unsafe_allow_html=True)
     
@@ -822,6 +1673,7 @@ def step_6_ai_insights():
                 season_stats,
                 location_stats
             )
+            st.caption(f"Resumo dos dados enviado ao ChatGPT: {count_tokens(data_summary)} tokens (limite de {SUMMARY_TOKEN_BUDGET}).")
             
             st.markdown("<h3 class='step-header'>Perguntas para o ChatGPT</h3>", unsafe_allow_html=True)
             
@@ -849,9 +1701,60 @@ def step_6_ai_insights():
             
             if final_question and final_question != "Selecione uma pergunta...":
                 if st.button("Gerar Insights com IA"):
-                    with st.spinner("Gerando insights com IA... Isso pode levar alguns segundos."):
-                        insights = get_chatgpt_insights(data_summary, final_question)
-                        st.session_state.insights = insights
+                    # O texto aparece enquanto é gerado; o resultado final vai para a sessão
+                    live = st.empty()
+                    with live.container():
+                        insights = st.write_stream(stream_chatgpt_insights(data_summary, final_question))
+                    st.session_state.insights = insights
+                    live.empty()
+                    if st.session_state.llm_metrics:
+                        last_call = st.session_state.llm_metrics[-1]
+                        st.caption(
+                            f"Primeiro token em {last_call['Primeiro Token (s)']:.2f} s • "
+                            f"resposta completa em {last_call['Total (s)']:.2f} s"
+                            + (" • resposta do cache" if last_call['Cache'] else "")
+                        )
+            
+            if st.button("Perguntar Todas as Perguntas Pré-definidas"):
+                # As perguntas são enviadas em paralelo por uma tarefa em segundo plano; a página
+                # continua respondendo e um novo clique não repete as chamadas. A tarefa só é
+                # compartilhada entre sessões com a mesma chave: cada chave paga pelas próprias
+                # chamadas, e respostas já obtidas vêm do cache de respostas
+                key = (
+                    dataset_fingerprint(st.session_state.data), 'ask_questions', tuple(question_options),
+                    api_key_hash(st.session_state.api_key or "")
+                )
+                st.session_state.cancelled_jobs.discard(key)
+                st.session_state.insights_job = key
+            
+            if st.session_state.insights_job is not None:
+                key = st.session_state.insights_job
+                
+                # As respostas aparecem à medida que chegam, na ordem das perguntas
+                def show_answers(job):
+                    answers = dict(job.partial)
+                    for i, question in enumerate(key[2]):
+                        st.markdown(f"**{question}**")
+                        if i in answers:
+                            st.markdown(answers[i])
+                        else:
+                            st.info("⏳ Aguardando resposta...")
+                
+                job = background_job(
+                    key, "Insights para todas as perguntas", ask_questions_in_background,
+                    data_summary, list(key[2]), st.session_state.api_key, cache=get_llm_response_cache(),
+                    show_partial=show_answers
+                )
+                if job is not None:
+                    st.session_state.insights = "\n\n".join(
+                        f"#### {question}\n\n{answer}" for question, answer in zip(key[2], job.result)
+                    )
+                    finish_job(key)
+                    st.session_state.insights_job = None
+            
+            if st.session_state.llm_metrics:
+                with st.expander("Métricas de latência das chamadas"):
+                    st.dataframe(pd.DataFrame(st.session_state.llm_metrics), use_container_width=True, hide_index=True)
             
             if st.session_state.insights:
                 st.markdown("<h3 class='step-header'>Insights Gerados pela IA</h3>", unsafe_allow_html=True)
@@ -877,6 +1780,7 @@ def step_6_ai_insights():
             st.experimental_rerun()
 
 # Etapa 7: Conclusões e Recomendações
+@get_profiler().profile("step_7_conclusions")
 def step_7_conclusions():
     st.markdown("<h2 class='sub-header'>Etapa 7: Conclusões e Recomendações</h2>", unsafe_allow_html=True)
     
@@ -923,8 +1827,7 @@ def step_7_conclusions():
             
             with col2:
                 st.markdown("#### Estações por Vendas Totais")
-                season_order = ["Verão", "Outono", "Inverno", "Primavera"]
-                sorted_seasons = season_stats.set_index('Estação').loc[season_order].reset_index()
+                sorted_seasons = season_stats.set_index('Estação').loc[SEASON_ORDER].reset_index()
                 for i, row in sorted_seasons.iterrows():
                     st.metric(f"{row['Estação']}", f"{row['Total']:,.0f} litros")
         
@@ -970,7 +1873,8 @@ def step_7_conclusions():
             st.session_state.current_step = 1
             st.experimental_rerun()
 
-# Executar a etapa atual
+# Executar a etapa atual, liberando as tarefas em segundo plano das etapas deixadas
+release_stale_jobs(st.session_state.current_step)
 if st.session_state.current_step == 1:
     step_1_data_ingestion()
 elif st.session_state.current_step == 2:
@@ -986,6 +1890,11 @@ elif st.session_state.current_step == 6:
 elif st.session_state.current_step == 7:
     step_7_conclusions()
 
+# Painel de desempenho na barra lateral, montado depois da etapa para incluir as medições desta execução
+with st.sidebar:
+    if st.checkbox("⏱️ Painel de desempenho", key="show_profiling"):
+        show_profiling_panel()
+
 # Rodapé
 st.markdown("---")
 st.markdown(
@@ -0,0 +1,79 @@
+import os
+import re
+import subprocess
+import sys
+import argparse
+
+# Diretório raiz do projeto, de onde os módulos são importados
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Orçamentos de importação: tempo acumulado máximo (ms) do módulo, medido com
+# python -X importtime, e módulos pesados que não podem ser carregados na partida.
+# A importação de app executa a primeira renderização (etapa 1 com o arquivo de exemplo)
+IMPORT_BUDGETS = {
+    "analysis_engine": {
+        "budget_ms": 150,
+        "forbidden": ["pandas", "numpy", "pyarrow", "streamlit", "plotly", "openai"]
+    },
+    "app": {
+        "budget_ms": 1500,
+        "forbidden": ["plotly.express", "openai", "statsmodels"]
+    }
+}
+
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+# Importa o módulo em um interpretador novo e devolve o tempo acumulado (ms) e o
+# conjunto de módulos carregados, lidos da saída de -X importtime
+def measure_import(module):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT_DIR,
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"falha ao importar {module}:\n{result.stderr[-2000:]}")
+    cumulative = None
+    loaded = set()
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match is None:
+            continue
+        loaded.add(match.group(4))
+        if match.group(4) == module and match.group(3) == " ":
+            cumulative = int(match.group(2)) / 1000
+    return cumulative, loaded
+
+# Mede cada módulo repeat vezes (vale a menor medida) e compara com os orçamentos,
+# multiplicados por scale para máquinas mais lentas; devolve True se todos passarem
+def check_budgets(budgets=IMPORT_BUDGETS, repeat=3, scale=1.0):
+    passed = True
+    print(f"{'módulo':<20}{'tempo (ms)':>12}{'orçamento':>12}  situação")
+    for module, budget in budgets.items():
+        timings = []
+        loaded = set()
+        for _ in range(repeat):
+            elapsed, modules = measure_import(module)
+            timings.append(elapsed)
+            loaded |= modules
+        elapsed = min(timings)
+        limit = budget["budget_ms"] * scale
+        forbidden = sorted(name for name in budget["forbidden"] if name in loaded)
+        ok = elapsed <= limit and not forbidden
+        passed = passed and ok
+        status = "ok" if ok else "ACIMA DO ORÇAMENTO" if elapsed > limit else "FALHOU"
+        print(f"{module:<20}{elapsed:>12.1f}{limit:>12.1f}  {status}")
+        if forbidden:
+            print(f"    módulos carregados na partida: {', '.join(forbidden)}")
+    return passed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Verifica os orçamentos de tempo de importação")
+    parser.add_argument("--repeat", type=int, default=3, help="medições por módulo (vale a menor)")
+    parser.add_argument("--scale", type=float, default=1.0, help="fator aplicado aos orçamentos")
+    args = parser.parse_args(argv)
+    return 0 if check_budgets(repeat=args.repeat, scale=args.scale) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,262 @@
+import os
+import sys
+import argparse
+import json
+import platform
+import tempfile
+import time
+
+# Diretório raiz do projeto, de onde o motor de análise é importado
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import numpy as np
+import pandas as pd
+from analysis_engine import (
+    SEASON_ORDER, IngestionCache, AggregationCube, FilterIndex, StepProfiler,
+    read_sales_table, stream_sales_table, preprocess_data, cube_stats, correlation_tables, histogram_frame
+)
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Configurações do gerador sintético: nomes reais para as primeiras cidades e marcas,
+# vendas médias por estação na escala do arquivo de exemplo e ruído log-normal
+BENCHMARK_CITIES = ["São Paulo", "Rio de Janeiro", "Belo Horizonte", "Santa Catarina"]
+BENCHMARK_BRANDS = ["Heineken", "Spaten", "Brahma", "Skol", "Budweiser", "Stella Artois", "Corona", "Amstel"]
+BENCHMARK_SEASON_SALES = {'Verão': 150_000, 'Outono': 105_000, 'Inverno': 80_000, 'Primavera': 115_000}
+BENCHMARK_CHUNK_ROWS = 1_000_000
+
+# Configurações das medições
+BENCHMARK_ROWS = [10_000, 100_000, 1_000_000]
+BENCHMARK_BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+BENCHMARK_TOLERANCE = 1.25
+BENCHMARK_MIN_SECONDS = 0.05
+
+# Tabela sintética com o esquema do CSV de vendas. Os fatores de marca e bairro dependem só
+# de seed, e as linhas de (seed, chunk): o mesmo arquivo é gerado em blocos de qualquer tamanho
+def generate_sales(rows, bairros=100, marcas=2, cidades=4, seed=0, chunk=0):
+    factors = np.random.default_rng(seed)
+    brand_factor = factors.uniform(0.7, 1.3, marcas)
+    bairro_factor = factors.uniform(0.8, 1.2, bairros)
+    city_names = [BENCHMARK_CITIES[i] if i < len(BENCHMARK_CITIES) else f"Cidade {i + 1}" for i in range(cidades)]
+    brand_names = [BENCHMARK_BRANDS[i] if i < len(BENCHMARK_BRANDS) else f"Marca {i + 1}" for i in range(marcas)]
+    bairro_names = [f"Bairro {i + 1:05d}" for i in range(bairros)]
+
+    rng = np.random.default_rng([seed, chunk])
+    bairro_codes = rng.integers(0, bairros, rows)
+    season_codes = rng.integers(0, len(SEASON_ORDER), rows)
+    brand_codes = rng.integers(0, marcas, rows)
+    season_sales = np.array([BENCHMARK_SEASON_SALES[season] for season in SEASON_ORDER], dtype=np.float64)
+    sales = season_sales[season_codes] * brand_factor[brand_codes] * bairro_factor[bairro_codes] * rng.lognormal(0, 0.25, rows)
+    return pd.DataFrame({
+        'Cidade': pd.Categorical.from_codes(bairro_codes % cidades, city_names),
+        'Bairro': pd.Categorical.from_codes(bairro_codes, bairro_names),
+        'Estação': pd.Categorical.from_codes(season_codes, SEASON_ORDER),
+        'Marca': pd.Categorical.from_codes(brand_codes, brand_names),
+        'Vendas (litros)': np.round(sales).astype(np.int64)
+    })
+
+# Grava o CSV sintético em blocos, sem manter a tabela inteira em memória; um arquivo
+# existente com os mesmos parâmetros é reaproveitado
+def write_sales_csv(directory, rows, bairros=100, marcas=2, cidades=4, seed=0, chunk_rows=BENCHMARK_CHUNK_ROWS):
+    path = os.path.join(directory, f"vendas_{rows}_b{bairros}_m{marcas}_c{cidades}_s{seed}.csv")
+    if os.path.exists(path):
+        return path
+    tmp_path = f"{path}.tmp"
+    for chunk, start in enumerate(range(0, rows, chunk_rows)):
+        table = generate_sales(min(chunk_rows, rows - start), bairros, marcas, cidades, seed, chunk)
+        table.to_csv(tmp_path, mode="w" if chunk == 0 else "a", header=chunk == 0, index=False)
+    os.replace(tmp_path, path)
+    return path
+
+# Caminho de filtro da etapa 4 sem a interface: seleção por bitmaps, subcubo, roll-ups
+# dos gráficos de barras e histograma das vendas filtradas
+def filter_path(df, cube, index):
+    selections = {
+        'Cidade': index.options('Cidade')[:max(1, len(index.options('Cidade')) // 2)],
+        'Bairro': index.options('Bairro')[::2],
+        'Estação': SEASON_ORDER[:2]
+    }
+    positions = index.select(selections)
+    filtered_cube = cube.filter(selections)
+    for dims in (['Marca'], ['Estação'], ['Cidade', 'Bairro'], ['Marca', 'Estação']):
+        filtered_cube.rollup(dims)
+    sales = df['Vendas (litros)'].to_numpy(dtype=np.float64)
+    histogram_frame(sales if positions is None else sales[positions])
+    return 0 if positions is None else len(positions)
+
+# Executa as etapas do pipeline sobre o CSV e devolve {etapa: medição}
+def run_stages(path, rows, cache_dir, trace_memory=False):
+    profiler = StepProfiler(trace_memory=trace_memory)
+    records = {}
+
+    def stage(name, func):
+        with profiler.measure(name, rows) as record:
+            value = func()
+        records[name] = record
+        return value
+
+    df = stage("load_data", lambda: read_sales_table(path))
+    # Leitura pelo cache de ingestão: o snapshot é gravado antes e lido por uma instância
+    # nova do cache, como na primeira sessão de um servidor reiniciado
+    read_sales_table(path, IngestionCache(cache_dir, 0, 2 ** 62))
+    stage("load_data_snapshot", lambda: read_sales_table(path, IngestionCache(cache_dir, 0, 2 ** 62)))
+    stage("load_data_streaming", lambda: stream_sales_table(path))
+    df_clean = stage("preprocess_data", lambda: preprocess_data(df)[0])
+    df = None
+
+    # As estatísticas da etapa 3 saem do cubo, construído uma vez por dataset
+    def build_stats():
+        cube = AggregationCube.build(df_clean)
+        cube_stats(cube)
+        return cube
+
+    cube = stage("generate_stats", build_stats)
+    stage("analyze_correlations", lambda: correlation_tables(df_clean, cube))
+    index = stage("filter_index", lambda: FilterIndex(df_clean))
+    stage("filter_select", lambda: filter_path(df_clean, cube, index))
+    profiler.set_trace_memory(False)
+    return records
+
+# Mede todas as etapas para cada tamanho: o tempo é o menor de repeat execuções sem
+# tracemalloc e, com memory, o pico vem de uma execução a mais com tracemalloc ativo
+def run_benchmarks(sizes, bairros, marcas, cidades, seed, repeat=1, memory=True, data_dir=None, on_result=None):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir = data_dir or tmp_dir
+        os.makedirs(data_dir, exist_ok=True)
+        for rows in sizes:
+            path = write_sales_csv(data_dir, rows, bairros, marcas, cidades, seed)
+            timings = {}
+            for i in range(repeat):
+                cache_dir = os.path.join(tmp_dir, f"cache_{rows}_{i}")
+                for name, record in run_stages(path, rows, cache_dir).items():
+                    timings[name] = min(timings.get(name, np.inf), record['seconds'])
+            peaks = {}
+            if memory:
+                cache_dir = os.path.join(tmp_dir, f"cache_{rows}_memory")
+                peaks = {name: record['peak_bytes'] for name, record in run_stages(path, rows, cache_dir, trace_memory=True).items()}
+            for name, seconds in timings.items():
+                result = {
+                    'rows': rows,
+                    'stage': name,
+                    'seconds': seconds,
+                    'rows_per_second': rows / seconds if seconds > 0 else None,
+                    'peak_bytes': peaks.get(name)
+                }
+                results.append(result)
+                if on_result is not None:
+                    on_result(result)
+    return results
+
+def environment_info():
+    return {
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'date': time.strftime('%Y-%m-%d')
+    }
+
+# Pico de memória residente do processo (MB), quando o sistema informa
+def max_rss_mb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 ** 2 if sys.platform == "darwin" else rss / 1024
+
+# Compara com a referência: uma etapa regrediu quando o tempo ou o pico de memória passa
+# de tolerance vezes o valor de referência. Etapas com referência abaixo de
+# BENCHMARK_MIN_SECONDS só têm a memória comparada, pois o tempo é dominado por ruído
+def compare_with_baseline(results, baseline, tolerance=BENCHMARK_TOLERANCE):
+    reference = {(entry['rows'], entry['stage']): entry for entry in baseline['results']}
+    comparisons = []
+    for result in results:
+        entry = reference.get((result['rows'], result['stage']))
+        if entry is None:
+            continue
+        time_ratio = result['seconds'] / entry['seconds'] if entry['seconds'] else None
+        memory_ratio = (
+            result['peak_bytes'] / entry['peak_bytes']
+            if result.get('peak_bytes') is not None and entry.get('peak_bytes') else None
+        )
+        regressed = (
+            (time_ratio is not None and entry['seconds'] >= BENCHMARK_MIN_SECONDS and time_ratio > tolerance)
+            or (memory_ratio is not None and memory_ratio > tolerance)
+        )
+        comparisons.append(dict(result, time_ratio=time_ratio, memory_ratio=memory_ratio, regressed=regressed))
+    return comparisons
+
+def format_ratio(ratio):
+    return "-" if ratio is None else f"{ratio:.2f}x"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark do pipeline de análise sobre dados sintéticos")
+    parser.add_argument("--rows", type=float, nargs="+", default=BENCHMARK_ROWS, help="tamanhos em linhas (ex.: 1e4 1e6 1e8)")
+    parser.add_argument("--bairros", type=int, default=100, help="número de bairros distintos")
+    parser.add_argument("--marcas", type=int, default=2, help="número de marcas distintas")
+    parser.add_argument("--cidades", type=int, default=4, help="número de cidades distintas")
+    parser.add_argument("--seed", type=int, default=0, help="semente do gerador")
+    parser.add_argument("--repeat", type=int, default=3, help="execuções por tamanho (vale o menor tempo)")
+    parser.add_argument("--no-memory", action="store_true", help="não mede o pico de memória com tracemalloc")
+    parser.add_argument("--data-dir", default=None, help="diretório onde os CSVs sintéticos são gravados e reaproveitados")
+    parser.add_argument("--output", default=None, help="grava os resultados neste arquivo JSON")
+    parser.add_argument("--baseline", default=BENCHMARK_BASELINE_PATH, help="arquivo JSON de referência")
+    parser.add_argument("--save-baseline", action="store_true", help="grava os resultados como nova referência")
+    parser.add_argument("--tolerance", type=float, default=BENCHMARK_TOLERANCE, help="razão máxima aceita em relação à referência")
+    args = parser.parse_args(argv)
+
+    params = {'bairros': args.bairros, 'marcas': args.marcas, 'cidades': args.cidades, 'seed': args.seed}
+    print(f"{'linhas':>12}  {'etapa':<22}{'tempo (s)':>11}{'linhas/s':>14}{'pico (MB)':>11}")
+
+    def report(result):
+        peak = "-" if result['peak_bytes'] is None else f"{result['peak_bytes'] / 1024 ** 2:.1f}"
+        throughput = "-" if result['rows_per_second'] is None else f"{result['rows_per_second']:,.0f}"
+        print(f"{result['rows']:>12,}  {result['stage']:<22}{result['seconds']:>11.4f}{throughput:>14}{peak:>11}")
+
+    results = run_benchmarks(
+        [int(rows) for rows in args.rows],
+        repeat=args.repeat,
+        memory=not args.no_memory,
+        data_dir=args.data_dir,
+        on_result=report,
+        **params
+    )
+    report_data = {'environment': environment_info(), 'params': params, 'max_rss_mb': max_rss_mb(), 'results': results}
+    rss = report_data['max_rss_mb']
+    if rss is not None:
+        print(f"Pico de memória residente do processo: {rss:.1f} MB")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report_data, f, ensure_ascii=False, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report_data, f, ensure_ascii=False, indent=2)
+        print(f"Referência gravada em {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print("Sem referência para comparar; use --save-baseline para criá-la.")
+        return 0
+
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    if baseline['params'] != params:
+        print(f"Referência gerada com outros parâmetros ({baseline['params']}); comparação ignorada.")
+        return 0
+    comparisons = compare_with_baseline(results, baseline, args.tolerance)
+    print(f"\nComparação com a referência de {baseline['environment']['date']} (tolerância {args.tolerance:.2f}x):")
+    for comparison in comparisons:
+        status = "REGRESSÃO" if comparison['regressed'] else "ok"
+        print(
+            f"{comparison['rows']:>12,}  {comparison['stage']:<22}"
+            f"tempo {format_ratio(comparison['time_ratio']):>7}  memória {format_ratio(comparison['memory_ratio']):>7}  {status}"
+        )
+    return 1 if any(comparison['regressed'] for comparison in comparisons) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import stats
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from analysis_engine import association_tables, chi2_sf, preprocess_data, read_sales_table
+
+SAMPLE_CSV = os.path.join(ROOT_DIR, "vendas_cerveja_expandida.csv")
+
+# Eta², H e p-valor de referência calculados com o scipy para cada dimensão
+def reference_sales_association(df, col):
+    sub = df[df[col].notna() & df['Vendas (litros)'].notna()]
+    y = sub['Vendas (litros)'].to_numpy(dtype=np.float64)
+    groups = [g['Vendas (litros)'].to_numpy(dtype=np.float64) for _, g in sub.groupby(col, observed=True)]
+    h, p_value = stats.kruskal(*groups)
+    means = sub.groupby(col, observed=True)['Vendas (litros)'].transform('mean').to_numpy(dtype=np.float64)
+    eta_squared = ((means - y.mean()) ** 2).sum() / ((y - y.mean()) ** 2).sum()
+    return eta_squared, h, p_value
+
+def reference_cramers_v(df, a, b):
+    table = pd.crosstab(df[a], df[b]).to_numpy()
+    chi2 = stats.chi2_contingency(table, correction=False)[0]
+    return np.sqrt(chi2 / (table.sum() * (min(table.shape) - 1)))
+
+def check_against_scipy(df):
+    result = association_tables(df)
+    sales = result['sales_association'].set_index('Dimensão')
+    for col in sales.index:
+        eta_squared, h, p_value = reference_sales_association(df, col)
+        assert sales.loc[col, 'Eta²'] == pytest.approx(eta_squared, rel=1e-9, abs=1e-12)
+        assert sales.loc[col, 'H (Kruskal-Wallis)'] == pytest.approx(h, rel=1e-9)
+        assert sales.loc[col, 'p-valor'] == pytest.approx(p_value, rel=1e-6, abs=1e-300)
+    cramers_v = result['cramers_v'].set_index('Dimensão')
+    dims = list(cramers_v.index)
+    for i, a in enumerate(dims):
+        assert cramers_v.loc[a, a] == 1.0
+        for b in dims[i + 1:]:
+            expected = reference_cramers_v(df, a, b)
+            assert cramers_v.loc[a, b] == pytest.approx(expected, rel=1e-9, abs=1e-12)
+            assert cramers_v.loc[b, a] == cramers_v.loc[a, b]
+
+def test_sample_file_matches_scipy():
+    df = preprocess_data(read_sales_table(SAMPLE_CSV))[0]
+    check_against_scipy(df)
+
+def test_raw_and_categorical_inputs_agree():
+    raw = read_sales_table(SAMPLE_CSV)
+    clean = preprocess_data(raw)[0]
+    raw_result = association_tables(raw)
+    clean_result = association_tables(clean)
+    pd.testing.assert_frame_equal(raw_result['sales_association'], clean_result['sales_association'])
+    pd.testing.assert_frame_equal(raw_result['cramers_v'], clean_result['cramers_v'])
+
+def test_missing_categories_match_scipy():
+    df = preprocess_data(read_sales_table(SAMPLE_CSV))[0]
+    df.loc[df.index[:25], 'Bairro'] = np.nan
+    check_against_scipy(df)
+
+# Vendas com apenas dois valores: cada grupo de empates passa de 2,1 milhões de linhas,
+# acima do limite em que ties ** 3 estouraria em int64
+def test_heavy_ties_match_scipy():
+    rng = np.random.default_rng(0)
+    n = 5_000_000
+    marca = rng.integers(0, 2, n)
+    estacao = rng.integers(0, 4, n)
+    vendas = (rng.random(n) < 0.5 + 0.002 * marca).astype(np.int32)
+    df = pd.DataFrame({
+        'Estação': pd.Categorical.from_codes(estacao, ['Verão', 'Outono', 'Inverno', 'Primavera']),
+        'Marca': pd.Categorical.from_codes(marca, ['Heineken', 'Spaten']),
+        'Vendas (litros)': vendas
+    })
+    assert np.bincount(vendas).min() > 2_100_000
+    check_against_scipy(df)
+
+@pytest.mark.parametrize("dof", [1, 2, 3, 4, 7, 96, 1999])
+@pytest.mark.parametrize("x", [0.01, 0.5, 3.0, 25.0, 400.0, 2500.0])
+def test_chi2_sf_matches_scipy(x, dof):
+    assert chi2_sf(x, dof) == pytest.approx(stats.chi2.sf(x, dof), rel=1e-9, abs=1e-300)
+
+# Duas dimensões com 100 mil categorias cada: a tabela densa teria 10¹⁰ células, então o
+# qui² de referência sai das contagens por par observado
+def test_high_cardinality_cramers_v():
+    rng = np.random.default_rng(1)
+    n = 300_000
+    bairro = rng.integers(0, 100_000, n)
+    cidade = np.where(rng.random(n) < 0.5, bairro, rng.integers(0, 100_000, n))
+    df = pd.DataFrame({'Cidade': cidade.astype(str), 'Bairro': bairro.astype(str), 'Marca': bairro % 2})
+    result = association_tables(df)['cramers_v'].set_index('Dimensão')
+    observed = df.groupby(['Cidade', 'Bairro']).size()
+    row_totals = df['Cidade'].value_counts()
+    col_totals = df['Bairro'].value_counts()
+    expected = row_totals.reindex(observed.index.get_level_values(0)).to_numpy() * col_totals.reindex(observed.index.get_level_values(1)).to_numpy() / n
+    chi2 = (observed.to_numpy() ** 2 / expected).sum() - n
+    r = min(len(row_totals), len(col_totals)) - 1
+    assert result.loc['Cidade', 'Bairro'] == pytest.approx(np.sqrt(chi2 / (n * r)), rel=1e-9)
+    assert result.loc['Bairro', 'Marca'] == pytest.approx(1.0)
@@ -0,0 +1,102 @@
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import analysis_engine
+from analysis_engine import LLMResponseCache, complete_prompt_async, stream_prompt
+
+# Cliente local com a mesma interface do openai (chat.completions.create), que registra
+# as chamadas e responde em trechos quando stream=True
+class StubClient:
+    def __init__(self, reply="Vendas sobem no verão."):
+        self.reply = reply
+        self.calls = []
+        self.chat = SimpleNamespace(completions=self)
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        if kwargs.get("stream"):
+            words = self.reply.split(" ")
+            parts = [word + " " for word in words[:-1]] + words[-1:]
+            return iter(SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=part))]) for part in parts)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=self.reply))])
+
+class AsyncStubClient(StubClient):
+    async def create(self, **kwargs):
+        return super().create(**kwargs)
+
+# Relógio controlado pelo teste no lugar de time.time, para validade e ordem de acesso
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(analysis_engine.time, "time", lambda: now[0])
+    return now
+
+def make_cache(tmp_path, ttl=60, max_entries=10):
+    return LLMResponseCache(str(tmp_path / "llm.sqlite3"), ttl, max_entries)
+
+def test_miss_calls_client_and_stores_response(tmp_path, clock):
+    cache = make_cache(tmp_path)
+    client = StubClient()
+    metrics = []
+    assert "".join(stream_prompt("pergunta", client, cache=cache, metrics=metrics)) == client.reply
+    assert len(client.calls) == 1 and client.calls[0]["stream"] is True
+    assert (cache.hits, cache.misses, len(cache)) == (0, 1, 1)
+    assert metrics[0]["Cache"] is False and metrics[0]["Caracteres"] == len(client.reply)
+
+def test_hit_does_not_call_client(tmp_path, clock):
+    cache = make_cache(tmp_path)
+    client = StubClient()
+    list(stream_prompt("pergunta", client, cache=cache))
+    metrics = []
+    assert list(stream_prompt("pergunta", client, cache=cache, metrics=metrics)) == [client.reply]
+    assert len(client.calls) == 1
+    assert cache.hits == 1 and metrics[0]["Cache"] is True
+
+    # O mesmo cache atende o modo em lote, sem chamar o cliente assíncrono
+    async_client = AsyncStubClient("outra resposta")
+    answer = asyncio.run(complete_prompt_async("pergunta", async_client, asyncio.Semaphore(1), cache))
+    assert answer == client.reply and async_client.calls == []
+
+def test_entries_are_keyed_by_model_and_max_tokens(tmp_path, clock):
+    cache = make_cache(tmp_path)
+    client = StubClient()
+    list(stream_prompt("pergunta", client, cache=cache))
+    list(stream_prompt("pergunta", client, cache=cache, max_tokens=50))
+    list(stream_prompt("pergunta", client, cache=cache, model="outro-modelo"))
+    assert len(client.calls) == 3 and len(cache) == 3
+
+def test_expired_entry_is_a_miss(tmp_path, clock):
+    cache = make_cache(tmp_path, ttl=60)
+    client = StubClient()
+    list(stream_prompt("pergunta", client, cache=cache))
+    clock[0] += 59
+    list(stream_prompt("pergunta", client, cache=cache))
+    assert len(client.calls) == 1
+    clock[0] += 2
+    list(stream_prompt("pergunta", client, cache=cache))
+    assert len(client.calls) == 2 and cache.misses == 2
+
+def test_evicts_least_recently_accessed_entry(tmp_path, clock):
+    cache = make_cache(tmp_path, max_entries=2)
+    keys = [LLMResponseCache.make_key(prompt, "modelo", 100) for prompt in ("a", "b", "c")]
+    cache.put(keys[0], "modelo", "resposta a")
+    clock[0] += 1
+    cache.put(keys[1], "modelo", "resposta b")
+    clock[0] += 1
+    assert cache.get(keys[0]) == "resposta a"
+    clock[0] += 1
+    cache.put(keys[2], "modelo", "resposta c")
+    assert len(cache) == 2
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) == "resposta a" and cache.get(keys[2]) == "resposta c"
+
+    # As entradas sobrevivem à reabertura do arquivo
+    reopened = make_cache(tmp_path, max_entries=2)
+    assert reopened.get(keys[2]) == "resposta c"